@@ -0,0 +1,92 @@
+import os
+import pathlib
+import subprocess
+import tempfile
+import time
+
+from dragon.run import compile_file
+
+# Times allocation throughput with the runtime's size class allocator and with plain malloc (-DDRGN_MALLOC): first
+# allocating and freeing blocks of mixed sizes in batches directly, then a Dragon program which creates and deletes an
+# object and a string on every iteration of its loop.
+# Set CC to the C compiler to use.
+
+CC = os.environ.get("CC", "clang")
+STD_FILES = pathlib.Path(__file__).parent.parent / "dragon" / "std_files"
+
+ALLOCS = 20_000_000
+BATCH = 1000
+
+MICRO = f"""
+#include <stdio.h>
+#include "alloc.h"
+
+int main() {{
+    static void* blocks[{BATCH}];
+    static const size_t sizes[] = {{16, 24, 40, 48, 64, 72, 96, 200}};
+    for (long i = 0; i < {ALLOCS} / {BATCH}; i++) {{
+        for (int j = 0; j < {BATCH}; j++) {{
+            blocks[j] = drgn_alloc(sizes[j % 8]);
+        }}
+        for (int j = {BATCH} - 1; j >= 0; j--) {{
+            drgn_free(blocks[j], sizes[j % 8]);
+        }}
+    }}
+    return 0;
+}}
+"""
+
+PROGRAM = """
+class Point {
+    attr x: int;
+    attr y: int;
+}
+
+def make(n: int) -> int {
+    var p: Point = new Point();
+    p.x = n;
+    var name: String = "point";
+    return p.x;
+}
+
+def main() -> int {
+    var total: int = 0;
+    var n: int = 0;
+    while (n < 5000000) {
+        total = total + make(n) / 1000;
+        n = n + 1;
+    }
+    print(total);
+    return 0;
+}
+"""
+
+
+def timed(exe: pathlib.Path) -> float:
+    start = time.perf_counter()
+    subprocess.run([str(exe)], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'benchmark':>10} {'allocator':>10} {'seconds':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+
+        micro = tmp / "micro.c"
+        micro.write_text(MICRO)
+        for name, flags in (("malloc", ["-DDRGN_MALLOC"]), ("pool", [])):
+            exe = tmp / f"micro_{name}"
+            subprocess.run([CC, "-O3", *flags, f"-I{STD_FILES}", "-o", str(exe), str(micro),
+                            str(STD_FILES / "alloc.c")], check=True)
+            print(f"{'micro':>10} {name:>10} {timed(exe):>10.3f}")
+
+        program = tmp / "objects.drgn"
+        program.write_text(PROGRAM)
+        for name, flags in (("malloc", " -DDRGN_MALLOC"), ("pool", "")):
+            compile_file(program, compiler=CC + flags)
+            print(f"{'objects':>10} {name:>10} {timed(program.with_suffix('')):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import time
+
+from dragon.common import cgen
+
+# Times member lookups on the leaf class of inheritance chains of increasing depth.
+# All three should stay flat as the chain grows, since each class keeps a flattened member table, and the fields which
+# reach each member and ancestor, so that every expression is a single GetAttr however deep the owning class is.
+
+LOOKUPS = 100_000
+
+
+def chain(depth: int) -> cgen.ClassType:
+    cls = cgen.Object
+    for n in range(depth):
+        cls = cgen.ClassType(f"Level{n}", [cls])
+        cls.attrs[f"attr_{n}"] = cgen.Int
+        cls.methods[f"method_{n}"] = cgen.SingleFuncType([cgen.VoidPtr], cgen.Void, f"Level{n}_method_{n}")
+        cls.func_names[f"method_{n}"] = f"Level{n}_method_{n}"
+        cls.finalize()
+    return cls
+
+
+def main():
+    print(f"{'depth':>10} {'get_name':>10} {'name_expr':>10} {'cast_expr':>10} {'us/lookup':>10}")
+    for depth in (1, 10, 50):
+        leaf = chain(depth)
+        obj = cgen.GetVar("obj")
+        timings = []
+
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            leaf.get_name("attr_0")
+        timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            leaf.get_name_expr(obj, "method_0")
+        timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            leaf.cast_expr(obj, cgen.Object)
+        timings.append(time.perf_counter() - start)
+
+        per_lookup = sum(timings) / (LOOKUPS * len(timings)) * 1_000_000
+        print(f"{depth:>10} {timings[0]:>10.3f} {timings[1]:>10.3f} {timings[2]:>10.3f} {per_lookup:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
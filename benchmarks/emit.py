@@ -0,0 +1,83 @@
+import io
+import pathlib
+import time
+
+from dragon.common import cgen
+
+# Times generating the C for a synthetic program of 100k statements, nested in ifs and whiles, by streaming it through
+# a Writer and by building a string per statement as the cgen nodes used to, where every enclosing block copies the
+# text of everything inside it again.
+
+STATEMENTS = 100_000
+PER_BLOCK = 10
+DEPTH = 10
+FUNCTIONS = 10
+
+
+def body(n: int, depth: int) -> cgen.Statement:
+    stmts = [cgen.ExprStmt(cgen.SetVar("x", cgen.BinOp(cgen.GetVar("x"), "+", cgen.Constant(n + i))))
+             for i in range(PER_BLOCK)]
+    if depth > 0:
+        stmts.append(cgen.If(cgen.BinOp(cgen.GetVar("x"), "<", cgen.Constant(n)),
+                             body(n + PER_BLOCK, depth - 1), cgen.Block([cgen.Return(cgen.GetVar("x"))])))
+    return cgen.Block(stmts) if depth % 2 else cgen.While(cgen.GetVar("x"), cgen.Block(stmts))
+
+
+def program() -> cgen.Program:
+    functions = []
+    nests = STATEMENTS // (PER_BLOCK * (DEPTH + 1) * FUNCTIONS)
+    for f in range(FUNCTIONS):
+        stmts = [cgen.Declare(cgen.Int, "x", cgen.Constant(0))]
+        stmts += [body(n, DEPTH) for n in range(nests)]
+        stmts.append(cgen.Return(cgen.GetVar("x")))
+        functions.append(cgen.Function(f"func_{f}", {}, cgen.Int, stmts))
+    return cgen.Program(functions, pathlib.Path("synthetic.drgn"))
+
+
+def as_string(stmt: cgen.Statement, indent=0) -> str:
+    """The string building which the statements did before they were written into a Writer"""
+    if isinstance(stmt, cgen.Block):
+        stmts = [''] + [as_string(inner, indent + 1) for inner in stmt.stmts] + ['']
+        return "    " * indent + "{" + "\n".join(stmts) + "    " * indent + "}"
+    elif isinstance(stmt, cgen.If):
+        ret = "    " * indent + f"if ({stmt.cond.generate()}) "
+        if isinstance(stmt.then_do, cgen.Block):
+            ret += as_string(stmt.then_do, indent).lstrip() + " else "
+        else:
+            ret += "\n" + as_string(stmt.then_do, indent + 1) + "\n" + "    " * indent + "else "
+        if isinstance(stmt.else_do, cgen.Block):
+            return ret + as_string(stmt.else_do, indent).lstrip()
+        else:
+            return ret + "\n" + as_string(stmt.else_do, indent + 1)
+    elif isinstance(stmt, cgen.While):
+        ret = "    " * indent + f"while ({stmt.cond.generate()}) "
+        if isinstance(stmt.do, cgen.Block):
+            return ret + as_string(stmt.do, indent).lstrip()
+        else:
+            return ret + "\n" + as_string(stmt.do, indent + 1)
+    else:
+        return stmt.generate(indent)
+
+
+def generate_strings(prog: cgen.Program, header: io.StringIO, source: io.StringIO):
+    for function in prog.top_levels:
+        header.write(function.declaration() + "\n\n")
+        def_ = function.ret.as_func_ret_def(function.name, function.args) + " {\n"
+        for stmt in function.body:
+            def_ += as_string(stmt, 1) + "\n"
+        source.write(def_ + "}\n\n\n")
+
+
+def main():
+    prog = program()
+    print(f"{'emitter':>10} {'seconds':>10} {'MB':>10}")
+    for name, generate in (("strings", generate_strings), ("writer", lambda p, h, s: p.generate("synthetic", h, s))):
+        header, source = io.StringIO(), io.StringIO()
+        start = time.perf_counter()
+        generate(prog, header, source)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10} {elapsed:>10.3f} {len(source.getvalue()) / 1_000_000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
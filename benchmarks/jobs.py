@@ -0,0 +1,56 @@
+import pathlib
+import tempfile
+import time
+
+from dragon.passes import compile_drgn, parse, scan
+
+# Times resolving and compiling a program of many classes with several methods each (but no C compiler) with
+# increasing numbers of jobs, to check that compiling the bodies in parallel pays for the processes.
+
+CLASSES = 150
+METHODS = 8
+
+
+def generate() -> str:
+    parts = []
+    for index in range(CLASSES):
+        base = f"(C{index - 1})" if index else ""
+        methods = "".join(f"""
+    method m{method}(n: int) -> int {{
+        var total: int = self.x + n;
+        var i: int = 0;
+        while (i < n) {{
+            total = total + i * {method};
+            i = i + 1;
+        }}
+        return total;
+    }}
+""" for method in range(METHODS))
+        parts.append(f"class C{index}{base} {{\n    attr x: int;\n{methods}}}\n")
+    parts.append(f"""
+def main() -> int {{
+    var obj: C{CLASSES - 1} = new C{CLASSES - 1}();
+    print(obj.m0(10));
+    return 0;
+}}
+""")
+    return "".join(parts)
+
+
+def main():
+    print(f"{'jobs':>10} {'seconds':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "classes.drgn"
+        path.write_text(generate())
+        for jobs in (1, 2, 4):
+            tree = parse(scan(path.read_text()))
+            start = time.perf_counter()
+            unit = compile_drgn(tree, path, jobs=jobs)
+            for program in unit.programs:
+                for top_level in program.top_levels:
+                    top_level.definition()
+            print(f"{jobs:>10} {time.perf_counter() - start:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
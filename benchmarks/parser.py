@@ -0,0 +1,27 @@
+import time
+
+from dragon.passes import scan, parse
+
+from benchmarks.scanner import generate
+
+# Times `parse` over already scanned token lists of increasing length.
+# The time per token should stay roughly flat as the token count grows, since advancing a stream is O(1).
+
+
+def tokens_for(count: int):
+    # the generated sources have roughly one token every four characters
+    return scan(generate(count * 4))
+
+
+def main():
+    print(f"{'tokens':>10} {'seconds':>10} {'us/token':>10}")
+    for count in (1_000, 10_000, 100_000, 1_000_000):
+        tokens = tokens_for(count)
+        start = time.perf_counter()
+        parse(tokens)
+        elapsed = time.perf_counter() - start
+        print(f"{len(tokens):>10} {elapsed:>10.3f} {elapsed / len(tokens) * 1_000_000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import pathlib
+import tempfile
+from typing import List
+
+from dragon.common import ast, cgen
+from dragon.passes import compile_drgn, parse, scan
+
+# Counts the reference counting operations compiled into each function of the examples and of a synthetic program whose
+# hot loop calls small methods, with the ownership analysis and as before it, when every object local took a reference
+# and every return released those of all the locals and parameters in scope. The operations of a function run on every
+# call, so small methods called in loops weigh the most.
+
+EXAMPLES = pathlib.Path(__file__).parent.parent / "examples"
+
+HOT_LOOP = """
+class Node {
+    attr val: int;
+    attr next: Node;
+
+    method get_val() -> int {
+        return self.val;
+    }
+
+    method get_next() -> Node {
+        var next: Node = self.next;
+        return next;
+    }
+}
+
+def sum(first: Node, count: int) -> int {
+    var total: int = 0;
+    var node: Node = first;
+    var i: int = 0;
+    while (i < count) {
+        var current: Node = node;
+        total = total + current.get_val();
+        node = current.get_next();
+        i = i + 1;
+    }
+    return total;
+}
+
+def main() -> int {
+    var first: Node = new Node();
+    first.next = first;
+    var total: int = 0;
+    var n: int = 0;
+    while (n < 1000) {
+        total = total + sum(first, 1000);
+        n = n + 1;
+    }
+    print(total);
+    return 0;
+}
+"""
+
+
+def functions(tree: ast.Program):
+    """
+    Yields the name and body of each function, method and constructor of `tree`
+    """
+    for top_level in tree.top_level:
+        if isinstance(top_level, ast.Function):
+            yield top_level.name, top_level.body
+        elif isinstance(top_level, ast.OverloadedFunction):
+            for overload in top_level.overloads:
+                yield top_level.name, overload.body
+        elif isinstance(top_level, ast.Class):
+            # the instantiations of a generic class share their body with it
+            for body_stmt in top_level.body:
+                if isinstance(body_stmt, ast.Method):
+                    yield f"{top_level.name}.{body_stmt.name}", body_stmt.body
+                elif isinstance(body_stmt, ast.Constructor):
+                    yield f"{top_level.name}.new", body_stmt.body
+
+
+def count(body: List[ast.Stmt]):
+    """
+    Returns:
+        The number of references taken and released by `body`, before and after the ownership analysis
+    """
+    before, after = 0, 0
+    for node in ast.walk(body):
+        if isinstance(node, ast.VarStmt) and cgen.is_cls(node.val.meta["ret"]):
+            before += 1
+            after += not node.meta["borrowed"]
+        elif isinstance(node, ast.ReturnStmt):
+            before += len(node.meta["to delete"].objects())
+            after += len(node.meta["decref"]) + len(node.meta["release"])
+    return before, after
+
+
+def compile_program(path: pathlib.Path) -> ast.Program:
+    tree = parse(scan(path.read_text()))
+    compile_drgn(tree, path)
+    return tree
+
+
+def main():
+    programs = {}
+    cwd = os.getcwd()
+    os.chdir(EXAMPLES)
+    try:
+        for path in sorted(EXAMPLES.glob("*.drgn")):
+            programs[path.stem] = compile_program(path)
+    finally:
+        os.chdir(cwd)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / "hot_loop.drgn"
+        path.write_text(HOT_LOOP)
+        programs[path.stem] = compile_program(path)
+
+    print(f"{'function':>30} {'before':>8} {'after':>8}")
+    totals = [0, 0]
+    for program, tree in programs.items():
+        for name, body in functions(tree):
+            before, after = count(body)
+            totals[0] += before
+            totals[1] += after
+            if before:
+                print(f"{program + ':' + name:>30} {before:>8} {after:>8}")
+    print(f"{'total':>30} {totals[0]:>8} {totals[1]:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import time
+
+from dragon.passes import scan
+
+# Times `scan` over generated sources of increasing size.
+# The time per MB should stay roughly flat as the source grows, since scanning is linear in the size of the source.
+
+MACRO = '''
+#macro $( FOR($init:stmt $cond:expr; $each:expr) $body:stmt )$ => stmt:
+       $( {
+              $init
+              while ($cond) {
+                  $body
+                  $each;
+              }
+          } )$
+#endmacro
+'''
+
+FUNCTION = '''
+# Function number {n}
+def func_{n}(a: int, b: String) -> int {{
+    var total: int = 0x1F;
+    FOR(var i: int = 0; i < a; i = i + 1) {{
+        total = total + i * 2 - (i // 3);
+        print("iteration {n}\\n");
+    }}
+    if (total >= 100) {{
+        return total;
+    }} else {{
+        return b.get_item(0) as int;
+    }}
+}}
+'''
+
+
+def generate(size: int) -> str:
+    parts = [MACRO]
+    length = len(MACRO)
+    n = 0
+    while length < size:
+        part = FUNCTION.format(n=n)
+        parts.append(part)
+        length += len(part)
+        n += 1
+    return "".join(parts)
+
+
+def main():
+    print(f"{'size':>10} {'tokens':>10} {'seconds':>10} {'s/MB':>10}")
+    for size in (64_000, 256_000, 1_000_000, 4_000_000):
+        source = generate(size)
+        start = time.perf_counter()
+        tokens = scan(source)
+        elapsed = time.perf_counter() - start
+        print(f"{len(source):>10} {len(tokens):>10} {elapsed:>10.3f} {elapsed / (len(source) / 1_000_000):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
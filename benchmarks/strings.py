@@ -0,0 +1,58 @@
+import os
+import pathlib
+import subprocess
+import tempfile
+import time
+
+from dragon.run import compile_file
+
+# Times Dragon programs which evaluate a string literal, index a string and slice a long string on every iteration of
+# their loops, with the runtime's allocator and with plain malloc (-DDRGN_MALLOC).
+# Set CC to the C compiler to use.
+
+CC = os.environ.get("CC", "clang")
+
+LOOP = """
+def step(s: String, n: int) -> int {{
+    var x: String = {expr};
+    return n + 1;
+}}
+
+def main() -> int {{
+    var long: String = "The quick brown fox jumps over the lazy dog";
+    var n: int = 0;
+    while (n < 5000000) {{
+        n = step(long, n);
+    }}
+    print(n);
+    return 0;
+}}
+"""
+
+PROGRAMS = {
+    "literal": '"a string literal"',
+    "get_item": "s.get_item(4)",
+    "slice": "s.slice(4, 40)",
+}
+
+
+def timed(exe: pathlib.Path) -> float:
+    start = time.perf_counter()
+    subprocess.run([str(exe)], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'benchmark':>10} {'allocator':>10} {'seconds':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        for program_name, expr in PROGRAMS.items():
+            program = tmp / f"{program_name}.drgn"
+            program.write_text(LOOP.format(expr=expr))
+            for name, flags in (("malloc", " -DDRGN_MALLOC"), ("pool", "")):
+                compile_file(program, compiler=CC + flags)
+                print(f"{program_name:>10} {name:>10} {timed(program.with_suffix('')):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
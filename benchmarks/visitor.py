@@ -0,0 +1,63 @@
+import time
+
+from dragon.common import ast, Visitor
+
+# Times visiting a large synthetic tree with a cached dispatch table, and with a getattr on every visit as `Visitor`
+# used to do. The cached visitor should take a fraction of the time of the other.
+
+STATEMENTS = 20_000
+DEPTH = 20
+
+
+def tree() -> ast.Block:
+    stmts = []
+    for n in range(STATEMENTS):
+        expr = ast.GetVar(f"var_{n}")
+        for depth in range(DEPTH):
+            expr = ast.BinOp(expr, "+", ast.Literal("num", str(depth)) if depth % 2 else ast.GetVar("x"))
+        stmts.append(ast.ExprStmt(expr))
+    return ast.Block(stmts)
+
+
+class Counter(Visitor):
+    def __init__(self):
+        self.count = 0
+
+    def visit_Block(self, node: ast.Block):
+        for stmt in node.stmts:
+            self.visit(stmt)
+
+    def visit_ExprStmt(self, node: ast.ExprStmt):
+        self.visit(node.expr)
+
+    def visit_BinOp(self, node: ast.BinOp):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def default(self, obj):
+        self.count += 1
+
+
+class GetattrCounter(Counter):
+    def visit(self, obj, *args, **kwargs):
+        try:
+            method = getattr(self, "visit_" + obj.__class__.__name__)
+        except AttributeError:
+            method = self.default
+
+        return method(obj, *args, **kwargs)
+
+
+def main():
+    block = tree()
+    print(f"{'visitor':>15} {'seconds':>10}")
+    for visitor_cls in (GetattrCounter, Counter):
+        visitor = visitor_cls()
+        start = time.perf_counter()
+        visitor.visit(block)
+        elapsed = time.perf_counter() - start
+        print(f"{visitor_cls.__name__:>15} {elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import pathlib
 
-from dragon.run import run_file, compile_file
+from dragon.run import run_file, compile_file, check_file
+from dragon.passes.parse_cache import ParseCache
 import argparse
 
 
@@ -8,17 +9,26 @@ def main():
     parser = argparse.ArgumentParser(prog="dragon")
     parser.add_argument("file", help="The .drgn file to compile")
     parser.add_argument("--run", action="store_true", help="Run the resulting executable")
+    parser.add_argument("--check", action="store_true",
+                        help="Only check that the file resolves and compiles, without generating C or running clang")
     parser.add_argument("--show_c", action="store_true", help="Do not delete the .c and .h files")
     parser.add_argument("--compiler", default="clang", help="Set the compiler (defaults to clang)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Resolve and compile function bodies in this many processes (defaults to 1)")
+    parser.add_argument("--cache", action="store_true",
+                        help="Cache the parsed trees of imported files in the user's cache directory")
 
     args = parser.parse_args()
 
     place = pathlib.Path(args.file)
+    parse_cache = ParseCache() if args.cache else None
 
-    if args.run:
-        run_file(place, delete_c=not args.show_c, compiler=args.compiler)
+    if args.check:
+        check_file(place, jobs=args.jobs)
+    elif args.run:
+        run_file(place, delete_c=not args.show_c, compiler=args.compiler, jobs=args.jobs, parse_cache=parse_cache)
     else:
-        compile_file(place, delete_c=not args.show_c, compiler=args.compiler)
+        compile_file(place, delete_c=not args.show_c, compiler=args.compiler, jobs=args.jobs, parse_cache=parse_cache)
 
 
 if __name__ == "__main__":
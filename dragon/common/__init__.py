@@ -1,7 +1,6 @@
-from .token import Token
+from .token import Token, TokenArray
 from .dragon_error import DragonError
 from .ast_visitor import Visitor
-from .mutable_dict import MutableDict
 
 from . import dragon_ast as ast
 from . import dragon_cgen as cgen
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import io
 import pathlib
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
@@ -274,11 +275,41 @@ class StructType(DataType):
 
 
 # region statements
+class Writer:
+    """
+    Streams generated C into a file. Statements write themselves into it piece by piece, so nested blocks are never
+    built up as strings and joined again at every level.
+    """
+    def __init__(self, out: IO, indent=0):
+        self.out = out
+        self.indent = indent
+        """The number of levels the current statement is indented by"""
+
+    def write(self, s: str):
+        self.out.write(s)
+
+    def indentation(self):
+        self.out.write("    " * self.indent)
+
+    def emit(self, stmt: Statement, indent: int):
+        outer = self.indent
+        self.indent = indent
+        stmt.emit(self)
+        self.indent = outer
+
+
 @dataclass()
 class Statement(Node):
     @abstractmethod
+    def emit(self, out: Writer):
+        """
+        Writes this statement to `out`, starting with its indentation and without a trailing newline
+        """
+
     def generate(self, indent=0):
-        pass
+        buffer = io.StringIO()
+        self.emit(Writer(buffer, indent))
+        return buffer.getvalue()
 
 
 @dataclass()
@@ -287,19 +318,21 @@ class Declare(Statement):
     name: str
     val: Expression
 
-    def generate(self, indent=0):
+    def emit(self, out: Writer):
+        out.indentation()
         if self.val is None:
-            return "    "*indent + self.typ.with_name(self.name) + ";"
+            out.write(self.typ.with_name(self.name) + ";")
         else:
-            return "    "*indent + self.typ.with_name(self.name) + " = " + self.val.generate() + ";"
+            out.write(self.typ.with_name(self.name) + " = " + self.val.generate() + ";")
 
 
 @dataclass()
 class ExprStmt(Statement):
     expr: Expression
 
-    def generate(self, indent=0):
-        return "    "*indent + self.expr.generate() + ";"
+    def emit(self, out: Writer):
+        out.indentation()
+        out.write(self.expr.generate() + ";")
 
 
 @dataclass()
@@ -308,24 +341,24 @@ class If(Statement):
     then_do: Statement
     else_do: Statement
 
-    def generate(self, indent=0):
-        ret = "    " * indent + f"if ({self.cond.generate()}) "
+    def emit(self, out: Writer):
+        out.indentation()
+        out.write(f"if ({self.cond.generate()}) ")
         if isinstance(self.then_do, Block):
-            ret += self.then_do.generate(indent).lstrip()
-            ret += " else "
+            self.then_do.emit_braces(out)
+            out.write(" else ")
         else:
-            ret += "\n"
-            ret += self.then_do.generate(indent + 1)
-            ret += "\n" + "    " * indent + "else "
+            out.write("\n")
+            out.emit(self.then_do, out.indent + 1)
+            out.write("\n")
+            out.indentation()
+            out.write("else ")
 
         if isinstance(self.else_do, Block):
-            # ret += " "
-            ret += self.else_do.generate(indent).lstrip()
+            self.else_do.emit_braces(out)
         else:
-            ret += "\n"
-            ret += self.else_do.generate(indent + 1)
-
-        return ret
+            out.write("\n")
+            out.emit(self.else_do, out.indent + 1)
 
 
 @dataclass()
@@ -333,45 +366,61 @@ class While(Statement):
     cond: Expression
     do: Statement
 
-    def generate(self, indent=0):
-        ret = "    " * indent + f"while ({self.cond.generate()}) "
+    def emit(self, out: Writer):
+        out.indentation()
+        out.write(f"while ({self.cond.generate()}) ")
         if isinstance(self.do, Block):
-            ret += self.do.generate(indent).lstrip()
+            self.do.emit_braces(out)
         else:
-            ret += "\n"
-            ret += self.do.generate(indent + 1)
-        return ret
+            out.write("\n")
+            out.emit(self.do, out.indent + 1)
 
 
 @dataclass()
 class Block(Statement):
     stmts: List[Statement]
 
-    def generate(self, indent=0):
-        stmts = [''] + [stmt.generate(indent + 1) for stmt in self.stmts] + ['']
-        return "    " * indent + "{" + "\n".join(stmts) + "    " * indent + "}"
+    def emit(self, out: Writer):
+        out.indentation()
+        self.emit_braces(out)
+
+    def emit_braces(self, out: Writer):
+        """
+        Writes this block from its opening brace, for when it follows something else on the same line
+        """
+        out.write("{")
+        for stmt in self.stmts:
+            out.write("\n")
+            out.emit(stmt, out.indent + 1)
+        out.write("\n")
+        out.indentation()
+        out.write("}")
 
 
 @dataclass()
 class UnscopedBlock(Statement):
     stmts: List[Statement]
 
-    def generate(self, indent=0):
-        return "    " * indent + " ".join(stmt.generate(0)
-                                          if not isinstance(stmt, UnscopedBlock)
-                                          else (stmt.generate(0) + "\n" + "    " * indent)[:-1]
-                                          for stmt in self.stmts)
+    def emit(self, out: Writer):
+        out.indentation()
+        for i, stmt in enumerate(self.stmts):
+            if i > 0:
+                out.write(" ")
+            out.emit(stmt, 0)
+            if isinstance(stmt, UnscopedBlock) and out.indent > 0:
+                out.write("\n" + ("    " * out.indent)[:-1])
 
 
 @dataclass()
 class Return(Statement):
     expr: Expression
 
-    def generate(self, indent=0):
+    def emit(self, out: Writer):
+        out.indentation()
         if self.expr is None:
-            return "    " * indent + "return;"
+            out.write("return;")
         else:
-            return "    "*indent + "return " + self.expr.generate() + ";"
+            out.write("return " + self.expr.generate() + ";")
 
 
 @dataclass()
@@ -381,8 +430,9 @@ class StrStmt(Statement):
     def format(self, *args, **kwargs):
         return StrStmt(self.s.format(*args, **kwargs))
 
-    def generate(self, indent=0):
-        return "    " * indent + self.s
+    def emit(self, out: Writer):
+        out.indentation()
+        out.write(self.s)
 
 # endregion
 
@@ -397,6 +447,12 @@ class TopLevel(Node, ABC):
     def declaration(self) -> str:
         pass
 
+    def emit_definition(self, out: Writer):
+        out.write(self.definition())
+
+    def emit_declaration(self, out: Writer):
+        out.write(self.declaration())
+
 
 @dataclass()
 class Include(TopLevel):
@@ -435,32 +491,78 @@ class Struct(TopLevel):
         return "struct " + self.name + ";\n"
 
 
+@dataclass()
+class StaticStruct(TopLevel):
+    """A struct constant, private to the source file it is defined in"""
+    typ: StructType
+    name: str
+    fields: Dict[str, Expression]
+
+    def definition(self):
+        return f"static const {self.typ.with_name(self.name)} = {{" + "\n".join(
+            [''] + [f"    .{name} = {val.generate()}," for name, val in self.fields.items()] + ['']) + "};\n"
+
+    def declaration(self):
+        return ""
+
+
 @dataclass()
 class Function(TopLevel):
     name: str
     args: Dict[str, Type]
     ret: Type
     body: List[Statement]
+    inline: bool = field(default=False)
+    """Whether the function is defined static inline in the header, so that every file which calls it can inline it"""
 
     @property
     def func_type(self):
         return FunctionType(list(self.args.values()), self.ret)
 
     def definition(self):
-        def_ = self.ret.as_func_ret_def(self.name, self.args) + " {"
+        buffer = io.StringIO()
+        self.emit_definition(Writer(buffer))
+        return buffer.getvalue()
+
+    def declaration(self) -> str:
+        buffer = io.StringIO()
+        self.emit_declaration(Writer(buffer))
+        return buffer.getvalue()
+
+    def emit_definition(self, out: Writer):
+        if not self.inline:
+            self.emit_function(out)
+
+    def emit_declaration(self, out: Writer):
+        if self.inline:
+            out.write("static inline ")
+            self.emit_function(out)
+        else:
+            out.write(f"{self.func_type.as_func_ret(self.name)};")
+
+    def emit_function(self, out: Writer):
+        out.write(self.ret.as_func_ret_def(self.name, self.args) + " {")
         if len(self.body) == 0:
-            def_ += " }"
+            out.write(" }")
         else:
-            def_ += "\n"
+            out.write("\n")
             for stmt in self.body:
-                def_ += stmt.generate(1) + "\n"
-            def_ += "}\n"
-        return def_
+                out.emit(stmt, 1)
+                out.write("\n")
+            out.write("}\n")
 
-    def declaration(self) -> str:
-        # print(self.func_type)
-        decl = f"{self.func_type.as_func_ret(self.name)};"
-        return decl
+
+@dataclass()
+class StrTopLevel(TopLevel):
+    """A top level whose C was already generated, such as a function compiled in another process"""
+    decl: str
+    defn: str
+
+    def definition(self):
+        return self.defn
+
+    def declaration(self):
+        return self.decl
 
 
 class Program:
@@ -469,17 +571,19 @@ class Program:
         self.path = path
 
     def generate(self, name: str, header: IO, source: IO):
-        header.write(f"#ifndef {name.upper()}_H\n")
-        header.write(f"#define {name.upper()}_H\n")
+        header_out, source_out = Writer(header), Writer(source)
+
+        header_out.write(f"#ifndef {name.upper()}_H\n")
+        header_out.write(f"#define {name.upper()}_H\n")
 
-        source.write(f"#include \"{name}.h\"\n\n")
+        source_out.write(f"#include \"{name}.h\"\n\n")
         for top_level in self.top_levels:
-            header.write(top_level.declaration())
-            header.write("\n\n")
+            top_level.emit_declaration(header_out)
+            header_out.write("\n\n")
 
-            source.write(top_level.definition())
-            source.write("\n\n")
-        header.write(f"#endif  // {name.upper()}_H")
+            top_level.emit_definition(source_out)
+            source_out.write("\n\n")
+        header_out.write(f"#endif  // {name.upper()}_H")
 
 
 class Unit:
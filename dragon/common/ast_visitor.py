@@ -1,14 +1,45 @@
+import inspect
+from typing import Callable, ClassVar, Dict
+
 from .dragon_ast import Node
 
 
 class Visitor:
+    dispatch: ClassVar[Dict[type, Callable]] = {}
+    """Maps each type of node visited so far to the function which visits it, separately for each Visitor class"""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.dispatch = {}
+
     def visit(self, obj: Node, *args, **kwargs):
         try:
-            method = getattr(self, "visit_" + obj.__class__.__name__)
-        except AttributeError:
-            method = self.default
+            method = self.dispatch[obj.__class__]
+        except KeyError:
+            method = self.handler(obj.__class__)
+
+        return method(self, obj, *args, **kwargs)
+
+    @classmethod
+    def handler(cls, node_type: type) -> Callable:
+        """
+        Returns:
+            Callable: The function which visits nodes of type `node_type`, called with the visitor as its first arg
+        """
+        name = "visit_" + node_type.__name__
+        attr = inspect.getattr_static(cls, name, None)
+        if attr is None:
+            name = "default"
+            attr = inspect.getattr_static(cls, name)
+
+        if isinstance(attr, (staticmethod, classmethod)):
+            def method(self, *args, **kwargs):
+                return getattr(self, name)(*args, **kwargs)
+        else:
+            method = attr
 
-        return method(obj, *args, **kwargs)
+        cls.dispatch[node_type] = method
+        return method
 
     def default(self, obj, *args, **kwargs):
         raise AttributeError("No visitor for " + repr(obj))
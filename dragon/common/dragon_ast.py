@@ -1,5 +1,5 @@
-from dataclasses import dataclass, field
-from typing import Dict, Any, List, Tuple
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
 
 __all__ = ['Node',
 
@@ -36,6 +36,22 @@ class Node:
             raise Exception(f"Only one of .line or .pos defined")
 
 
+def walk(nodes: Iterable[Node]) -> Iterator[Node]:
+    """
+    Yields each of `nodes` and every node below them
+    """
+    for node in nodes:
+        yield node
+        for node_field in fields(node):
+            if node_field.name in ("line", "pos", "meta"):
+                continue
+            value = getattr(node, node_field.name)
+            if isinstance(value, Node):
+                yield from walk([value])
+            elif isinstance(value, list):
+                yield from walk(item for item in value if isinstance(item, Node))
+
+
 @dataclass()
 class Type(Node):
     pass
@@ -1,5 +1,4 @@
-from typing import Tuple
-from .mutable_dict import MutableDict
+from typing import Tuple, Optional, Hashable, Set, Dict
 
 from ._cgen import *
 
@@ -29,22 +28,136 @@ class ClassType(DataType):
 
         self.struct = StructType(name)
 
+        self._members: Optional[Dict[str, Tuple[Tuple['ClassType', ...], Type]]] = None
+        """Maps every attribute and method of this class or its bases to the path of classes from this class to the
+        one which declares it, and its type"""
+
+        self._funcs: Optional[Dict[str, Tuple[Tuple['ClassType', ...], str]]] = None
+        """Maps every func name inherited from a base to the path of classes to the base which implements it, and the
+        c name of the function"""
+
+        self._ancestors: Optional[Dict[int, Tuple['ClassType', ...]]] = None
+        """Maps the id of this class and each of its ancestors to the path of classes from this class to it"""
+
+        self._all_names: Optional[Set[str]] = None
+        self._fields: Optional[Dict[str, Type]] = None
+
+        self._accesses: Optional[Dict[str, str]] = None
+        """Maps every attribute and method to the fields which get it from an object of this class, as `access` does"""
+
+        self._casts: Optional[Dict[int, str]] = None
+        """Maps the id of each ancestor to the fields which cast an object of this class to it"""
+
+        self._func_casts: Optional[Dict[str, str]] = None
+        """Maps every inherited func name to the fields which cast an object of this class to the base implementing it"""
+
     @property
     def names(self):
         return tuple(self.attrs.keys()) + tuple(self.methods.keys()) + tuple(self.other.keys())
 
-    def add_name(self, name: str, ):
-        pass
+    def add_attr(self, name: str, typ: Type):
+        assert self._members is None, f"{self.name} is already finalized"
+        self.attrs[name] = typ
+
+    def add_method(self, name: str, typ: Type):
+        assert self._members is None, f"{self.name} is already finalized"
+        self.methods[name] = typ
+
+    def add_other(self, name: str, typ: Type):
+        assert self._members is None, f"{self.name} is already finalized"
+        self.other[name] = typ
+
+    def finalize(self):
+        """
+        Builds the lookup tables of this class from its own names and the tables of its bases.
+
+        The tables are otherwise built on the first lookup, after which no attributes, methods or others can be added.
+        """
+        members = {}
+        funcs = {}
+        ancestors = {id(self): (self,)}
+        all_names = set(self.attrs) | set(self.methods) | set(self.other)
+
+        for name, typ in self.attrs.items():
+            members[name] = ((self,), typ)
+        for name, typ in self.methods.items():
+            members.setdefault(name, ((self,), typ))
+
+        # each base is searched completely before the next one, so earlier bases take precedence
+        for base in self.bases:
+            for name, (path, typ) in base.members().items():
+                members.setdefault(name, ((self,) + path, typ))
+            for name, c_name in base.func_names.items():
+                funcs.setdefault(name, ((self, base), c_name))
+            for name, (path, c_name) in base.funcs().items():
+                funcs.setdefault(name, ((self,) + path, c_name))
+            for key, path in base.ancestors().items():
+                ancestors.setdefault(key, (self,) + path)
+            all_names |= base.all_names()
+
+        self._members = members
+        self._funcs = funcs
+        self._ancestors = ancestors
+        self._all_names = all_names
+        self._fields = None
+
+        # so that lookups emit one GetAttr, rather than one per class between this one and the one they reach
+        self._casts = {key: self.access(path) for key, path in ancestors.items()}
+        self._func_casts = {name: self.access(path) for name, (path, _) in funcs.items()}
+        self._accesses = {}
+        for name, (path, _) in members.items():
+            cast = self.access(path)
+            self._accesses[name] = cast + "." + name if cast else name
+
+    def members(self) -> Dict[str, Tuple[Tuple['ClassType', ...], Type]]:
+        if self._members is None:
+            self.finalize()
+        return self._members
+
+    def funcs(self) -> Dict[str, Tuple[Tuple['ClassType', ...], str]]:
+        if self._funcs is None:
+            self.finalize()
+        return self._funcs
+
+    def ancestors(self) -> Dict[int, Tuple['ClassType', ...]]:
+        if self._ancestors is None:
+            self.finalize()
+        return self._ancestors
+
+    def all_names(self) -> Set[str]:
+        if self._all_names is None:
+            self.finalize()
+        return self._all_names
+
+    def accesses(self) -> Dict[str, str]:
+        if self._accesses is None:
+            self.finalize()
+        return self._accesses
+
+    @staticmethod
+    def access(path: Tuple['ClassType', ...]) -> str:
+        """
+        Returns:
+            str: The fields, joined by dots, which cast an object along `path` (whose first class is its type) to the
+            last class of `path`, or "" if `path` only holds its type
+        """
+        return ".".join('parent_' + base.name for base in path[1:])
+
+    @staticmethod
+    def walk(obj: Expression, path: Tuple['ClassType', ...]) -> Expression:
+        """
+        Returns:
+            Expression: `obj` cast along `path` (whose first class is the type of `obj`) to the last class of `path`
+        """
+        access = ClassType.access(path)
+        return GetAttr(obj, access) if access else obj
 
     def has_name(self, name: str):
-        if name in self.names:
+        # own names are checked directly, since the resolver calls this while still adding them
+        if name in self.attrs or name in self.methods or name in self.other:
             return True
         else:
-            for base in self.bases:
-                if base.has_name(name):
-                    return True
-            else:
-                return False
+            return any(name in base.all_names() for base in self.bases)
 
     def get_name(self, name: str) -> Type:
         """
@@ -53,18 +166,10 @@ class ClassType(DataType):
         Raises:
             KeyError: If `name` is not an attribute of this class or any of its bases
         """
-        if name in self.attrs:
-            return self.attrs[name]
-        elif name in self.methods:
-            return self.methods[name]
-        else:
-            for base in self.bases:
-                try:
-                    return base.get_name(name)
-                except KeyError:
-                    pass
-            else:
-                raise KeyError(name)
+        try:
+            return self.members()[name][1]
+        except KeyError:
+            raise KeyError(name) from None
 
     def get_func_name(self, name: str) -> str:
         """
@@ -75,15 +180,13 @@ class ClassType(DataType):
         Raises:
             KeyError: If `name` is not an attribute of this class or any of its bases
         """
+        # own func names are checked directly, since new and del are added after the class is finalized
         if name in self.func_names:
             return self.func_names[name]
-        else:
-            for base in self.bases:
-                try:
-                    return base.get_func_name(name)
-                except KeyError:
-                    pass
-            raise KeyError(name)
+        try:
+            return self.funcs()[name][1]
+        except KeyError:
+            raise KeyError(name) from None
 
     def get_name_expr(self, obj: Expression, name: str) -> Expression:
         """
@@ -95,16 +198,10 @@ class ClassType(DataType):
         Raises:
             KeyError: If `name` is not an attribute of this class or any of its bases
         """
-        if name in self.methods or name in self.attrs:
-            return GetAttr(obj, name)
-        else:
-            for base in self.bases:
-                try:
-                    return base.get_name_expr(GetAttr(obj, 'parent_' + base.name), name)
-                except KeyError:
-                    pass
-            else:
-                raise KeyError(name)
+        try:
+            return GetAttr(obj, self.accesses()[name])
+        except KeyError:
+            raise KeyError(name) from None
 
     def set_name_expr(self, obj: Expression, name: str, val: Expression):
         """
@@ -117,48 +214,64 @@ class ClassType(DataType):
         Raises:
             KeyError: If `name` is not an attribute of this class or any of its bases
         """
-        if name in self.methods or name in self.attrs:
-            return SetAttr(obj, name, val)
-        else:
-            for base in self.bases:
-                try:
-                    return base.set_name_expr(GetAttr(obj, 'parent_'+base.name), name, val)
-                except KeyError:
-                    pass
-            raise KeyError(name)
+        try:
+            return SetAttr(obj, self.accesses()[name], val)
+        except KeyError:
+            raise KeyError(name) from None
 
     def path_to_parent(self, typ: 'ClassType'):
-        if typ is self:
-            return [self]
-        else:
-            for base in self.bases:
-                try:
-                    return base.path_to_parent(typ) + [self]
-                except KeyError:
-                    pass
-            raise KeyError(typ)
+        try:
+            path = self.ancestors()[id(typ)]
+        except KeyError:
+            raise KeyError(typ) from None
+        return list(reversed(path))
 
     def cast_expr(self, obj: Expression, typ: 'ClassType'):
-        if typ is self:
-            return obj
-        else:
-            for base in self.bases:
-                try:
-                    return base.cast_expr(GetAttr(obj, 'parent_'+base.name), typ)
-                except KeyError:
-                    pass
-            raise KeyError(typ)
+        if self._casts is None:
+            self.finalize()
+        try:
+            cast = self._casts[id(typ)]
+        except KeyError:
+            raise KeyError(typ) from None
+        return GetAttr(obj, cast) if cast else obj
 
     def cast_for_name_expr(self, obj: Expression, name: str):
         if name in self.func_names:
             return obj
-        else:
-            for base in self.bases:
-                try:
-                    return base.cast_for_name_expr(GetAttr(obj, 'parent_'+base.name), name)
-                except KeyError:
-                    pass
-            raise KeyError(name)
+        if self._func_casts is None:
+            self.finalize()
+        try:
+            cast = self._func_casts[name]
+        except KeyError:
+            raise KeyError(name) from None
+        return GetAttr(obj, cast) if cast else obj
+
+    def has_vtable(self) -> bool:
+        """
+        Returns:
+            bool: Whether this class introduces methods, whose pointers are kept in a vtable rather than in each object
+        """
+        return bool(self.methods) and not is_builtin(self)
+
+    @property
+    def vtable(self) -> StructType:
+        return StructType(self.name + "_vtable")
+
+    def dispatcher_name(self, name: str) -> str:
+        """
+        Returns:
+            str: The c name of the inline function which calls the method `name` through the vtable of this class
+        """
+        return f"{self.name}_call_{name}"
+
+    def subobjects(self, path: Tuple['ClassType', ...] = ()):
+        """
+        Yields the path to this class and to every class embedded in it, as often as it is embedded, with the class
+        """
+        path = path + (self,)
+        yield path, self
+        for base in self.bases:
+            yield from base.subobjects(path)
 
     def all_attrs(self):
         yield from self.attrs.items()
@@ -177,12 +290,14 @@ class ClassType(DataType):
 
     @property
     def fields(self):
-        fields = {}
-        fields.update({'parent_'+base.name: base.struct for base in self.bases})
-        fields.update(self.attrs)
-        fields.update(self.methods)
-        fields.update(self.other)
-        return fields
+        if self._fields is None:
+            fields = {}
+            fields.update({'parent_'+base.name: base.struct for base in self.bases})
+            fields.update(self.attrs)
+            fields.update(self.methods)
+            fields.update(self.other)
+            self._fields = fields
+        return self._fields
 
 
 class GenericClassType(DataType):
@@ -192,8 +307,6 @@ class GenericClassType(DataType):
         self.node = node
         self.scope = scope
 
-        self.generics: Dict[Tuple[str, ...], ClassType] = {}
-
 
 class NullType(DataType):
     typ = "int"
@@ -246,27 +359,120 @@ class SingleFuncType(FuncType, FunctionType):
         return super().as_func_ret_def(name, func_args, ptrs + 1)
 
 
+def type_key(typ: Type) -> Hashable:
+    """
+    Returns:
+        Hashable: A key which is equal for two types exactly when they are the same type. Classes are only ever the
+        same as themselves, while other types are compared by their structure
+    """
+    if isinstance(typ, FunctionType):
+        return "function", tuple(type_key(arg) for arg in typ.args), type_key(typ.ret)
+    elif isinstance(typ, PointerType):
+        return "pointer", type_key(typ.pointee)
+    elif isinstance(typ, (ClassType, GenericClassType)):
+        return "class", id(typ)
+    else:
+        return typ.__class__.__name__, typ.as_type()
+
+
+class Signature:
+    """
+    The argument names and types and the return type of a function, frozen so that it can be used as a dict key.
+
+    Its hash is computed once, from the `type_key` of each type.
+    """
+    __slots__ = ('args', 'ret', 'key', 'hash')
+
+    def __init__(self, args: Dict[str, Type], ret: Type):
+        self.args: Tuple[Tuple[str, Type], ...] = tuple(args.items())
+        self.ret = ret
+
+        self.key = tuple((name, type_key(typ)) for name, typ in self.args), type_key(ret)
+        self.hash = hash(self.key)
+
+    @property
+    def arg_types(self) -> List[Type]:
+        return [typ for _, typ in self.args]
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, Signature) and self.hash == other.hash and self.key == other.key
+
+    def __repr__(self):
+        return f"Signature({dict(self.args)!r}, {self.ret!r})"
+
+
+class AmbiguousOverloadError(Exception):
+    """Raised when more than one overload of a function needs the fewest coercions to be called with some arguments"""
+    def __init__(self, args: List[Type], overloads: List[Tuple[List[Type], Type, str]]):
+        super().__init__(args, overloads)
+        self.args = args
+        self.overloads = overloads
+
+
 class OverloadedFuncType(FuncType):
-    def __init__(self, overloads: MutableDict[Tuple[Dict[str, Type], Type], str]):
+    def __init__(self, overloads: Dict[Signature, str]):
         self.overloads = overloads
 
+        self.by_args: Dict[Tuple[Hashable, ...], Tuple[List[Type], Type, str]] = {}
+        """Maps the `type_key`s of the argument types of each overload to its argument types, return type and c name"""
+        for signature, c_name in overloads.items():
+            key = tuple(arg_key for _, arg_key in signature.key[0])
+            self.by_args.setdefault(key, (signature.arg_types, signature.ret, c_name))
+
+        self.matches: Dict[Tuple[Hashable, ...], Tuple[Tuple[Type, ...], Tuple[List[Type], Type, str]]] = {}
+        """Caches the best overload for some passed types, along with those types to keep the ids of classes in use"""
+
+    def overload_for(self, args: List[Type]) -> Tuple[List[Type], Type, str]:
+        """
+        Returns:
+            The argument types, return type and c name of the overload which is called with arguments of types `args`:
+            the overload which takes exactly those types if there is one, or else the one which needs the fewest
+            coercions
+        Raises:
+            KeyError: If no overload can be called with `args`
+            AmbiguousOverloadError: If no overload takes exactly `args`, and several need the fewest coercions
+        """
+        key = tuple(map(type_key, args))
+        try:
+            return self.by_args[key]
+        except KeyError:
+            pass
+        try:
+            return self.matches[key][1]
+        except KeyError:
+            pass
+
+        best, best_cost, tied = None, None, []
+        for overload in self.by_args.values():
+            if len(overload[0]) != len(args):
+                continue
+            costs = [coercion_cost(passed, expected) for passed, expected in zip(args, overload[0])]
+            if None in costs:
+                continue
+            if best_cost is None or sum(costs) < best_cost:
+                best, best_cost, tied = overload, sum(costs), []
+            elif sum(costs) == best_cost:
+                tied.append(overload)
+        if best is None:
+            raise KeyError(args)
+        if tied:
+            raise AmbiguousOverloadError(args, [best] + tied)
+
+        self.matches[key] = tuple(args), best
+        return best
+
     def ret_for(self, args: List[Type]):
-        for overload_args, ret in self.overloads.keys():
-            if [typ for _, typ in overload_args.items()] == args:
-                return ret
-        raise KeyError()
+        return self.overload_for(args)[1]
 
     def type_for(self, args: List[Type]):
-        for (overload_args, ret), c_name in self.overloads.items():
-            if [typ for _, typ in overload_args.items()] == args:
-                return SingleFuncType(args, ret, c_name)
-        raise KeyError()
+        overload_args, ret, c_name = self.overload_for(args)
+        return SingleFuncType(overload_args, ret, c_name)
 
     def c_name_for(self, args: List[Type]):
-        for (overload_args, ret), c_name in self.overloads.items():
-            if [typ for _, typ in overload_args.items()] == args:
-                return c_name
-        raise KeyError()
+        return self.overload_for(args)[2]
 
     def as_type(self, ptrs=0):
         raise NotImplementedError()
@@ -281,6 +487,28 @@ class OverloadedFuncType(FuncType):
         raise NotImplementedError()
 
 
+def coercion_cost(from_type: Type, to_type: Type) -> Optional[int]:
+    """
+    Returns:
+        Optional[int]: How many steps it takes to coerce a value of `from_type` to `to_type` (0 if they are the same
+        type), or None if it can't be coerced
+    """
+    if from_type is to_type:
+        return 0
+    if is_int(from_type) and is_cls(to_type):
+        # ints are boxed into an Integer, which is then cast
+        cost = coercion_cost(Integer, to_type)
+        return None if cost is None else cost + 1
+    if is_cls(from_type) and is_cls(to_type):
+        try:
+            return len(from_type.path_to_parent(to_type)) - 1
+        except KeyError:
+            return None
+    if not is_cls(from_type) and not is_cls(to_type) and from_type == to_type:
+        return 0
+    return None
+
+
 def is_int(typ):
     return typ is Int
 
@@ -301,7 +529,19 @@ def inc_ref(node: Expression) -> Expression:
     return Call(GetVar("drgn_inc_ref"), [node])
 
 
-def dec_refs(nodes: Iterable[Expression]) -> Statement:
+def release(node: Expression) -> Expression:
+    return Call(GetVar("DRGN_RELEASE"), [node])
+
+
+def hold(node: Expression) -> Expression:
+    return Call(GetVar("DRGN_HOLD"), [node])
+
+
+def unhold(node: Expression) -> Expression:
+    return Call(GetVar("DRGN_UNHOLD"), [node])
+
+
+def dec_refs(nodes: Iterable[Expression]) -> UnscopedBlock:
     return UnscopedBlock([ExprStmt(Call(GetVar("DRGN_DECREF"), [node])) for node in nodes])
 
 
@@ -310,6 +550,7 @@ CInt = IntType()
 Void = VoidType()
 VoidPtr = PointerType(Void)
 Int = CustomType("int32_t")
+Size = CustomType("size_t")
 Bool = BoolType()
 
 
@@ -322,11 +563,21 @@ Integer = ClassType("Integer", [Object])
 String = ClassType("String", [Object])
 C_Array = ClassType("_Array", [Object])
 
+builtin_classes = (Object, Integer, String, C_Array)
+"""The classes defined by the std_files, whose methods are stored in each object rather than in a vtable"""
+
+
+def is_builtin(cls: ClassType) -> bool:
+    return any(cls is builtin for builtin in builtin_classes)
+
+
 Object.methods = {"to_string": SingleFuncType([Object], String, "Object_to_string")}
 Object.func_names = {"to_string": "Object_to_string"}
 
-String.methods = {"get_item": SingleFuncType([String, Int], String, "String_get_item")}
-String.func_names = {"get_item": "String_get_item"}
+String.methods = {"get_item": SingleFuncType([String, Int], String, "String_get_item"),
+                  "slice": SingleFuncType([String, Int, Int], String, "String_slice")}
+String.func_names = {"get_item": "String_get_item",
+                     "slice": "String_slice"}
 
 C_Array.methods = {"get_item": SingleFuncType([C_Array, Int], Object, "_Array_get_item"),
                    "set_item": SingleFuncType([C_Array, Int, Object], Void, "_Array_set_item")}
@@ -40,4 +40,4 @@ class DragonError(Exception):
                 msg = self.message
 
             sys.stderr.write(msg + "\n")
-            sys.exit()
+            sys.exit(1)
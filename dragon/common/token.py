@@ -1,15 +1,87 @@
-from typing import Tuple
+import sys
+from array import array
+from typing import Tuple, List, Dict, Sequence
+
+__all__ = ['Token', 'TokenArray', 'intern_kind', 'kind_names']
+
+
+kind_names: List[str] = []
+"""The type of each kind of token, indexed by its kind number"""
+
+kind_numbers: Dict[str, int] = {}
+
+
+def intern_kind(typ: str) -> int:
+    """
+    Returns:
+        int: The small number which stands for the token type `typ` in a `TokenArray`
+    """
+    try:
+        return kind_numbers[typ]
+    except KeyError:
+        kind_names.append(sys.intern(typ))
+        kind_numbers[typ] = len(kind_names) - 1
+        return kind_numbers[typ]
 
 
 class Token:
-    def __init__(self, typ: str, text: str, line: int, pos: Tuple[int, int]):
+    __slots__ = ('type', 'kind', 'text', 'line', 'pos')
+
+    def __init__(self, typ: str, text: str, line: int, pos: Tuple[int, int], kind: int = None):
         self.type = typ
+        self.kind = intern_kind(typ) if kind is None else kind
+        """The kind number of `type`, which the parser compares rather than the string"""
         self.text = text
         self.line = line
         self.pos = pos
 
     def __eq__(self, other: 'Token'):
-        return self.type == other.type and self.text == other.text
+        return self.kind == other.kind and self.text == other.text
 
     def __repr__(self):
         return f"Token({self.type!r}, {self.text!r})"
+
+
+class TokenArray(Sequence[Token]):
+    """
+    The tokens of one source, stored as parallel arrays of numbers rather than as one `Token` object per token.
+
+    A token's type is stored as its kind number (see `intern_kind`), and its text as its start and end offsets into
+    the source. Indexing builds a `Token` view of the stored token, so the parser reads the arrays directly until it
+    consumes a token.
+    """
+    __slots__ = ('source', 'kinds', 'starts', 'ends', 'lines', 'columns')
+
+    def __init__(self, source: str):
+        self.source = source
+        self.kinds = array('B')
+        self.starts = array('L')
+        self.ends = array('L')
+        self.lines = array('L')
+        self.columns = array('L')
+        """The position of the start of each token within its line"""
+
+    def append(self, kind: int, start: int, end: int, line: int, column: int):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def __getitem__(self, index: int) -> Token:
+        start = self.starts[index]
+        end = self.ends[index]
+        column = self.columns[index]
+        kind = self.kinds[index]
+        return Token(kind_names[kind], self.source[start:end], self.lines[index], (column, column + end - start), kind)
+
+    def place(self, index: int) -> Tuple[int, Tuple[int, int]]:
+        """
+        Returns:
+            The line of the token `index` and the positions of its start and end within that line, as in `Token`
+        """
+        column = self.columns[index]
+        return self.lines[index], (column, column + self.ends[index] - self.starts[index])
+
+    def __len__(self):
+        return len(self.kinds)
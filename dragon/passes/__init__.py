@@ -1,3 +1,3 @@
 from .parser import parse
 from .compiler import compile_drgn
-from .scanner import scan
+from .scanner import scan, scan_iter
@@ -1,9 +1,13 @@
 import os
 import pathlib
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple, Union, Set
 
 from dragon.common import ast, DragonError, cgen, Visitor
 from dragon.passes.resolver import Resolver
+from dragon.passes.expander import Expander
+from dragon.passes.ownership import Ownership
+from dragon.passes.hierarchy import ClassHierarchy
+from dragon.passes.parse_cache import ParseCache
 
 
 class CompilingError(DragonError):
@@ -15,6 +19,21 @@ class Compiler(Visitor):
     def __init__(self):
         self.main_func = ''
         self.programs: List[cgen.Program] = []
+        self.compiled: Dict[pathlib.Path, cgen.Program] = {}
+        """Maps the resolved path of each module which has been compiled to its program, so each is compiled once"""
+
+        self.hierarchy = ClassHierarchy()
+        """Which method calls can be made directly, set once every class of the program is known"""
+
+        self.assumed: Set[Tuple[str, str]] = set()
+        """The class and method of each call made directly, which must stay without overrides for that to be valid"""
+
+        self.precompiled: Dict[int, List[cgen.TopLevel]] = {}
+        """Maps the id of each function, method or constructor node which was compiled by `compile_bodies` to its
+        functions"""
+
+        self.literals: Optional[List[cgen.Statement]] = None
+        """The static Strings defined for the string literals of the function being compiled"""
 
     def visit_Program(self, node: ast.Program, path: pathlib.Path, is_main=False):
         c_files = pathlib.Path(os.path.realpath(__file__)).parent.parent / "std_files"
@@ -35,11 +54,13 @@ class Compiler(Visitor):
                 raise CompilingError("No main function", -1, (0, 0))
 
             top_levels.append(cgen.Function("main", {}, cgen.CInt, [
-                cgen.StrStmt(f"return {self.main_func}();")
+                cgen.StrStmt(f"drgn_init();\n"
+                             f"return {self.main_func}();")
             ]))
 
         program = cgen.Program(top_levels, path)
         self.programs.append(program)
+        self.compiled[path.resolve()] = program
         return program
 
     @classmethod
@@ -51,8 +72,9 @@ class Compiler(Visitor):
 
     def visit_Import(self, node: ast.Import, is_main=False):
         program: ast.Program = node.meta["program"]
-        self.visit_Program(program, node.meta["path"])
         path: pathlib.Path = node.meta["path"]
+        if path.resolve() not in self.compiled:
+            self.visit_Program(program, path)
         return [cgen.Include(str(path.with_suffix('.h')), angled=False)]
 
     def visit_GenericClass(self, node: ast.GenericClass, is_main=False):
@@ -64,7 +86,7 @@ class Compiler(Visitor):
     @classmethod
     def new_empty(cls, cls_node: ast.Class, cls_type: cgen.ClassType):
         new_empty = cgen.Function("new_empty_" + cls_node.meta["c_name"], {}, cls_type, [
-            cgen.Declare(cls_type, "obj", cgen.Call(cgen.GetVar("malloc"), [cgen.SizeOf(cls_type.struct)])),
+            cgen.Declare(cls_type, "obj", cgen.Call(cgen.GetVar("drgn_alloc"), [cgen.SizeOf(cls_type.struct)])),
             cgen.StrStmt(f"obj->meta.self = obj;\n"
                          f"obj->meta.up = obj;\n"
                          f"obj->meta.ref_count = 0;\n"
@@ -81,9 +103,17 @@ class Compiler(Visitor):
             ),
 
             *(
-                cgen.ExprStmt(
-                    cls_type.set_name_expr(cgen.Deref(cgen.GetVar("obj")), method_name, cgen.GetVar(method_c_name)))
-                for method_name, method_c_name in cls_node.meta["all methods"].items()
+                cgen.ExprStmt(cgen.SetAttr(cls_type.walk(cgen.Deref(cgen.GetVar('obj')), path), "_vtable",
+                                           cgen.Ref(cgen.GetVar(cls.vtable_name(cls_type, part)))))
+                for path, part in cls_type.subobjects() if part.has_vtable()
+            ),
+
+            # every builtin part holds its own method pointers, including the ones embedded more than once
+            *(
+                cgen.ExprStmt(cgen.SetAttr(cls_type.walk(cgen.Deref(cgen.GetVar('obj')), path), method_name,
+                                           cgen.GetVar(cls_node.meta["builtin methods"][method_name])))
+                for path, part in cls_type.subobjects() if cgen.is_builtin(part)
+                for method_name in part.methods if method_name in cls_node.meta["builtin methods"]
             ),
             cgen.Return(cgen.GetVar('obj'))
         ])
@@ -105,6 +135,51 @@ class Compiler(Visitor):
         )
         return new_parent
 
+    @classmethod
+    def vtable_name(cls, cls_type: cgen.ClassType, part: cgen.ClassType):
+        return f"{cls_type.name}_vtable_{part.name}"
+
+    @classmethod
+    def vtables(cls, cls_type: cgen.ClassType):
+        """
+        An object finds its methods through one vtable for each class embedded in it which introduces methods. As the
+        function of each method expects its own part of the object, the vtable also holds the offset of that part.
+        """
+        vtables = {}
+        for _, part in cls_type.subobjects():
+            if not part.has_vtable() or part.name in vtables:
+                continue
+
+            entries = {}
+            for name, method_type in part.methods.items():
+                if name in cls_type.func_names:
+                    offset = cgen.Constant(0)
+                else:
+                    path, _ = cls_type.funcs()[name]
+                    designator = ".".join('parent_' + base.name for base in path[1:])
+                    offset = cgen.StrExpr(f"offsetof({cls_type.struct}, {designator})")
+                slot_type = cgen.FunctionType(method_type.args, method_type.ret)
+                entries[name] = cgen.Cast(cgen.GetVar(cls_type.get_func_name(name)), slot_type)
+                entries[name + "_offset"] = offset
+
+            vtables[part.name] = cgen.StaticStruct(part.vtable, cls.vtable_name(cls_type, part), entries)
+        return list(vtables.values())
+
+    @classmethod
+    def dispatcher(cls, cls_type: cgen.ClassType, name: str):
+        method_type: cgen.SingleFuncType = cls_type.methods[name]
+
+        args = {'obj': cls_type, **{f"arg_{i}": arg_type for i, arg_type in enumerate(method_type.args[1:])}}
+
+        passed = [cgen.StrExpr(f"(char*) obj->meta.self + obj->_vtable->{name}_offset")] + \
+                 [cgen.GetVar(f"arg_{i}") for i, arg_type in enumerate(method_type.args[1:])]
+
+        is_ret = not cgen.is_void(method_type.ret)
+        dispatcher = cgen.Function(cls_type.dispatcher_name(name), args, method_type.ret, [
+            (cgen.Return if is_ret else cgen.ExprStmt)(cgen.Call(cgen.StrExpr(f"obj->_vtable->{name}"), passed))
+        ], inline=True)
+        return dispatcher
+
     @classmethod
     def redirect(cls, cls_type: cgen.ClassType, name: str, func_name: str):
         redirect_type: cgen.FuncType = cls_type.get_name(name)
@@ -139,10 +214,21 @@ class Compiler(Visitor):
             **{'parent_' + base.name: base.struct for base in cls_type.bases},
 
             **cls_type.attrs,
-            **cls_type.methods,
         })
         cls_type.struct = cls_struct.struct_type
 
+        vtable_items = []
+        if cls_type.has_vtable():
+            cls_struct.fields['_vtable'] = cgen.PointerType(cgen.CustomType("const " + cls_type.vtable.typ))
+
+            vtable_struct = cgen.Struct(cls_type.vtable.name, {})
+            for method_name, method_type in cls_type.methods.items():
+                vtable_struct.fields[method_name] = method_type
+                vtable_struct.fields[method_name + "_offset"] = cgen.Size
+            vtable_items.append(vtable_struct)
+            vtable_items += [self.dispatcher(cls_type, name) for name in cls_type.methods]
+        vtable_items += self.vtables(cls_type)
+
         new_empty = self.new_empty(node, cls_type)
 
         redirects = []
@@ -161,7 +247,6 @@ class Compiler(Visitor):
                 cgen.StrStmt(f"{cls_type.with_name('obj')} = new_empty_{cls_type.name}();\n"
                              f"return obj;")
             ])
-            cls_type.func_names["new"] = new.name
             body_stmt_items.append(new)
 
         if not has_destructor:
@@ -169,30 +254,33 @@ class Compiler(Visitor):
                 cgen.StrStmt(f"{cls_type} self = obj;"),
                 cgen.dec_refs(cgen.StrExpr(f"self->{attr}")
                               for attr, typ in cls_type.attrs.items() if cgen.is_cls(typ)),
-                cgen.ExprStmt(cgen.Call(cgen.GetVar("free"), [cgen.GetVar("self")]))
+                cgen.ExprStmt(cgen.Call(cgen.GetVar("drgn_free"), [cgen.GetVar("self"), cgen.SizeOf(cls_type.struct)]))
             ])
             cls_type.func_names["del"] = del_.name
             body_stmt_items.append(del_)
 
-        return [cls_struct, new_empty, new_parent] + redirects + body_stmt_items
+        return [cls_struct] + vtable_items + [new_empty, new_parent] + redirects + body_stmt_items
 
     def visit_Attr(self, node: ast.Attr):
         return []
 
     def visit_Method(self, node: ast.Method):
+        if id(node) in self.precompiled:
+            return self.precompiled[id(node)]
+
         body = []
         body.append(cgen.Declare(node.meta["cls"], "self", cgen.Cast(cgen.GetVar("_self"), node.meta["cls"])))
-        for stmt in node.body:
-            body.append(self.visit(stmt))
+        body += self.visit_body(node.body)
         return [cgen.Function(node.meta["c_name"], node.meta["args"], node.meta["ret"], body)]
 
     def visit_Constructor(self, node: ast.Constructor):
+        if id(node) in self.precompiled:
+            return self.precompiled[id(node)]
+
         body = []
         cls_type = node.meta["cls"]
         body.append(cgen.Declare(node.meta["cls"], "self", cgen.StrExpr(f"new_empty_{cls_type.name}()")))
-
-        for stmt in node.body:
-            body.append(self.visit(stmt))
+        body += self.visit_body(node.body)
 
         body.append(cgen.Return(cgen.GetVar("self")))
 
@@ -202,20 +290,38 @@ class Compiler(Visitor):
         if node.meta["is main"] and is_main:
             self.main_func = node.meta["c_name"]
 
-        body = [self.visit(stmt) for stmt in node.body]
+        if id(node) in self.precompiled:
+            return self.precompiled[id(node)]
+
+        body = self.visit_body(node.body)
 
         return [cgen.Function(node.meta["c_name"], node.meta["c args"], node.meta["ret"], body)]
 
     def visit_OverloadedFunction(self, node: ast.OverloadedFunction, is_main=None):
+        if id(node) in self.precompiled:
+            return self.precompiled[id(node)]
+
         overloads = []
         for overload in node.overloads:
-            body = [self.visit(stmt) for stmt in overload.body]
+            body = self.visit_body(overload.body)
 
             func = cgen.Function(overload.meta["c_name"], overload.meta["c args"], overload.meta["ret"], body)
             overloads.append(func)
 
         return overloads
 
+    def visit_body(self, stmts: List[ast.Stmt]) -> List[cgen.Statement]:
+        """
+        Returns:
+            List[cgen.Statement]: The compiled `stmts` of a function, after the definitions of its string literals
+        """
+        outer, self.literals = self.literals, []
+        try:
+            body = [self.visit(stmt) for stmt in stmts]
+            return self.literals + body
+        finally:
+            self.literals = outer
+
     def visit_IfStmt(self, node: ast.IfStmt):
         return cgen.If(self.visit(node.cond), self.visit(node.then_do), self.visit(node.else_do))
 
@@ -227,7 +333,7 @@ class Compiler(Visitor):
 
     def visit_VarStmt(self, node: ast.VarStmt):
         val = self.coerce_node(node.val, node.meta["type"])
-        if cgen.is_cls(node.val.meta["ret"]):
+        if cgen.is_cls(node.val.meta["ret"]) and not node.meta["borrowed"]:
             val = cgen.inc_ref(val)
         return cgen.Declare(node.meta["type"], node.meta["c_name"], val)
 
@@ -235,8 +341,16 @@ class Compiler(Visitor):
         return cgen.ExprStmt(self.visit(node.expr))
 
     def visit_ReturnStmt(self, node: ast.ReturnStmt):
-        to_delete: Dict[str, str] = node.meta["to delete"]
-        dels = cgen.dec_refs(cgen.GetVar(c_name) for c_name in to_delete.values())
+        dels = cgen.dec_refs(cgen.GetVar(c_name) for c_name in node.meta["decref"])
+        dels.stmts += [cgen.ExprStmt(cgen.release(cgen.GetVar(c_name))) for c_name in node.meta["release"]]
+        if node.meta["decref"] and not isinstance(node.expr, (ast.Literal, ast.GetVar)):
+            # the returned value may be read from an object which is about to be deleted, so it is evaluated first, and
+            # an object is held until then, so that the caller gets it alive
+            ret = cgen.GetVar("_ret")
+            if cgen.is_cls(node.expr.meta["ret"]):
+                dels = cgen.UnscopedBlock([cgen.ExprStmt(cgen.hold(ret)), dels, cgen.ExprStmt(cgen.unhold(ret))])
+            return cgen.Block([cgen.Declare(node.expr.meta["ret"], "_ret", self.visit(node.expr)), dels,
+                               cgen.Return(ret)])
         return cgen.UnscopedBlock([dels, cgen.Return(self.visit(node.expr))])
 
     def visit_New(self, node: ast.New):
@@ -253,7 +367,7 @@ class Compiler(Visitor):
         else:
             if cgen.is_cls(to_type):
                 if cgen.is_int(from_type):
-                    as_object = cgen.Call(cgen.GetVar("_new_Integer"), [expr])
+                    as_object = cgen.Call(cgen.GetVar("drgn_box_int"), [expr])
                     return cgen.Ref(cgen.Integer.cast_expr(cgen.Deref(as_object), to_type))
                 else:
                     raise Exception(from_type, to_type)
@@ -267,12 +381,28 @@ class Compiler(Visitor):
         args = []
         if isinstance(node.callee, ast.GetAttr):
             obj = node.callee.obj
-            args.append(cgen.StrExpr(f"{self.visit(obj)}->meta.self"))
+            cls: cgen.ClassType = obj.meta["ret"]
+            name = node.callee.attr
             expected_args = node.meta["func"].args[1:]
 
+            func_name = self.hierarchy.direct_call(cls, name)
+            path, _ = cls.members()[name]
+            if func_name is None and path[-1].has_vtable() and name in path[-1].methods:
+                # dispatch through the vtable of the class which introduced the method
+                args.append(cgen.Ref(cls.walk(cgen.Deref(self.visit(obj)), path)))
+                callee = cgen.GetVar(path[-1].dispatcher_name(name))
+            elif func_name is None:
+                args.append(cgen.StrExpr(f"{self.visit(obj)}->meta.self"))
+                callee = self.visit(node.callee)
+            else:
+                # no class below cls overrides the method, so call what its function pointer always points to
+                self.assumed.add((cls.name, name))
+                args.append(cgen.Ref(cls.cast_for_name_expr(cgen.Deref(self.visit(obj)), name)))
+                callee = cgen.GetVar(func_name)
+
             args += [self.coerce_node(arg_node, expected) for arg_node, expected in zip(node.args, expected_args)]
 
-            return cgen.Call(self.visit(node.callee), args)
+            return cgen.Call(callee, args)
         else:
             poss_func_type: cgen.FuncType = node.callee.meta["ret"]
             passed = [arg.meta["ret"] for arg in node.args]
@@ -335,7 +465,13 @@ class Compiler(Visitor):
         if isinstance(node.meta["val"], str):
             val: str = node.meta["val"]
             esc_val = val.encode("utf-8").decode("unicode_escape")
-            return cgen.StrExpr(f"_new_String(\"{val}\", {len(esc_val)})")
+            if self.literals is None:
+                return cgen.StrExpr(f"_new_String(\"{val}\", {len(esc_val)})")
+
+            # a static String, which evaluating the literal doesn't need to allocate
+            name = f"_str_{len(self.literals)}"
+            self.literals.append(cgen.StrStmt(f"DRGN_STRING_LITERAL({name}, \"{val}\", {len(esc_val)});"))
+            return cgen.Ref(cgen.GetVar(name))
 
         return cgen.Constant(node.meta["val"])
 
@@ -343,10 +479,140 @@ class Compiler(Visitor):
         return self.visit(node.expr)
 
 
-def compile_drgn(tree, path: pathlib.Path) -> cgen.Unit:
-    resolver = Resolver()
-    resolver.visit_Program(tree)
+def compile_body(resolver: Resolver, compiler: Compiler, index: int, node: ast.Node, scope
+                 ) -> Union[Tuple[List[cgen.StrTopLevel], Set[Tuple[str, str]]], DragonError, None]:
+    """
+    Resolves and compiles `node`, the `index`th deferred body, in a worker process.
+
+    Returns:
+        The C generated for the functions compiled from the body and the direct calls they assume, the error raised
+        while resolving or compiling it, or None if it instantiated a generic class, since the new class must be
+        resolved and compiled in the parent process
+    """
+    instantiated = len(resolver.graph.generics)
+    try:
+        resolver.resolve_body(node, scope, index)
+        if len(resolver.graph.generics) != instantiated:
+            return None
+        compiler.assumed = set()
+        functions = compiler.visit(Ownership().visit(Expander().visit(node)))
+    except DragonError as e:
+        return e
+    # sent as text, since the functions refer to the types of the whole program, which would be pickled with them
+    return [cgen.StrTopLevel(function.declaration(), function.definition()) for function in functions], compiler.assumed
+
+
+def compile_worker(resolver: Resolver, compiler: Compiler, bodies: List[Tuple[int, Tuple[ast.Node, object]]],
+                   connection):
+    """
+    Runs in a forked process, which inherits rather than unpickles its arguments, and sends the results of
+    `compile_body` for each of the numbered `bodies` through `connection`.
+    """
+    try:
+        connection.send([compile_body(resolver, compiler, index, node, scope) for index, (node, scope) in bodies])
+    except BaseException as e:
+        connection.send(e)
+    finally:
+        connection.close()
+
+
+def compile_in_workers(resolver: Resolver, compiler: Compiler, bodies: List[Tuple[ast.Node, object]], jobs: int
+                       ) -> List:
+    """
+    Returns:
+        List: The result of `compile_body` for each of `bodies`, split between `jobs` forked processes, with None for
+        the bodies of any process which died before sending its results, or for all of them if processes can't be forked
+    """
+    # imported here rather than at the top, as it is slow to import and most compilations never need it
+    import multiprocessing
+
+    results: List = [None] * len(bodies)
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return results
+
+    context = multiprocessing.get_context("fork")
+    numbered = list(enumerate(bodies))
+    workers = []
+    for job in range(jobs):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=compile_worker, args=(resolver, compiler, numbered[job::jobs], sender),
+                                  daemon=True)
+        process.start()
+        sender.close()
+        workers.append((process, receiver))
+
+    for job, (process, receiver) in enumerate(workers):
+        with receiver:
+            try:
+                job_results = receiver.recv()
+            except EOFError:
+                # the process died before sending anything, so its bodies are resolved here instead
+                job_results = None
+        process.join()
+        if isinstance(job_results, BaseException):
+            raise job_results
+        if job_results is not None:
+            results[job::jobs] = job_results
+    return results
+
+
+def compile_bodies(resolver: Resolver, compiler: Compiler, jobs: int):
+    """
+    Resolves and compiles the bodies deferred by `resolver` in `jobs` processes, and has `compiler` use the results.
+    Each body is independent of the others, and numbers its names on its own, so the output doesn't depend on how
+    the bodies are split between processes, or whether there are any.
+
+    The processes are forked, so where that isn't possible, or with only one job, the bodies are resolved here one
+    after another instead.
+    """
+    bodies, resolver.deferred = resolver.deferred, None
+    if not bodies:
+        return
+
+    classes = len(resolver.classes)
+    assumed = {}
+
+    results: List = [None] * len(bodies)
+    if jobs > 1:
+        results = compile_in_workers(resolver, compiler, bodies, min(jobs, len(bodies)))
+
+    # in order, so that the first error is raised and generics are numbered the same as in any other run
+    for index, ((node, scope), result) in enumerate(zip(bodies, results)):
+        if isinstance(result, DragonError):
+            raise result
+        elif result is None:
+            resolver.resolve_body(node, scope, index)
+        else:
+            compiler.precompiled[id(node)], assumed[id(node)] = result
+
+    # the classes instantiated since the workers were forked may override methods they called directly
+    overridden = compiler.hierarchy.extend(resolver.classes[classes:])
+    if overridden:
+        for index, (node, scope) in enumerate(bodies):
+            if not assumed.get(id(node), set()).isdisjoint(overridden):
+                del compiler.precompiled[id(node)]
+                resolver.resolve_body(node, scope, index)
+
+
+def compile_drgn(tree, path: pathlib.Path, parse_cache: ParseCache = None, jobs: int = 1) -> cgen.Unit:
+    """
+    Parameters:
+        parse_cache (ParseCache): Where to load the trees of imported files from, if they should be cached at all
+        jobs (int): If more than 1, the bodies of functions, methods and constructors are resolved and compiled in a
+            pool of this many processes, once every signature and class has been resolved
+    """
+    resolver = Resolver(parse_cache)
     compiler = Compiler()
+    # deferred even with one job, so that the names of the signatures don't depend on how the bodies are resolved
+    resolver.deferred = []
+    resolver.visit_Program(tree, path)
+    compiler.hierarchy = ClassHierarchy(resolver.classes)
+    compile_bodies(resolver, compiler, jobs)
+
+    expander, ownership = Expander(compiler.precompiled), Ownership(compiler.precompiled)
+    for program in [tree] + [program for program, _ in resolver.graph.modules.values()]:
+        ownership.visit(expander.visit(program))
+
     compiler.visit_Program(tree, path, is_main=True)
     unit = cgen.Unit(compiler.programs)
     return unit
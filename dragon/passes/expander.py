@@ -1,38 +1,199 @@
-from typing import List, Dict
+from dataclasses import fields
+from typing import List, Optional, Container
 
 from dragon.common import ast, Visitor
 
+INT_BITS = 32
+"""The width of the int type (int32_t), which folded arithmetic wraps around at"""
+
+
+def wrap(value: int) -> int:
+    half = 1 << (INT_BITS - 1)
+    return (value + half) % (1 << INT_BITS) - half
+
+
+def fold(op: str, left: int, right: int) -> Optional[int]:
+    """
+    Returns:
+        Optional[int]: The value of `left` `op` `right` as computed by C, or None if it should be left to run time
+    """
+    if op == "+":
+        return wrap(left + right)
+    elif op == "-":
+        return wrap(left - right)
+    elif op == "*":
+        return wrap(left * right)
+    elif op == "/":
+        if right == 0:
+            return None
+        # C truncates towards zero, rather than flooring
+        quotient = abs(left) // abs(right)
+        if (left < 0) != (right < 0):
+            quotient = -quotient
+        return quotient if wrap(quotient) == quotient else None
+    elif op == "<":
+        return int(left < right)
+    elif op == ">":
+        return int(left > right)
+    elif op == "<=":
+        return int(left <= right)
+    elif op == ">=":
+        return int(left >= right)
+    elif op == "==":
+        return int(left == right)
+    elif op == "!=":
+        return int(left != right)
+    else:
+        return None
+
+
+def constant(node: ast.Expr) -> Optional[int]:
+    """
+    Returns:
+        Optional[int]: The value of `node` if it is an int literal, otherwise None
+    """
+    if isinstance(node, ast.Literal) and node.type == "num" and isinstance(node.meta.get("val"), int):
+        return node.meta["val"]
+    return None
+
+
+def always_returns(node: ast.Stmt) -> bool:
+    if isinstance(node, ast.ReturnStmt):
+        return True
+    elif isinstance(node, ast.Block):
+        return any(always_returns(stmt) for stmt in node.stmts)
+    elif isinstance(node, ast.IfStmt):
+        return always_returns(node.then_do) and always_returns(node.else_do)
+    else:
+        return False
+
 
 class Expander(Visitor):
-    def __init__(self):
-        pass
+    """
+    Simplifies a resolved tree before it is compiled. Arithmetic and comparisons of int literals (including the ones
+    macros expand to) are folded, if statements with a constant condition are replaced by the branch they take, while
+    loops which never run are dropped, and so are statements after a return.
+
+    Each visit returns the node which replaces the visited one.
+    """
+    def __init__(self, precompiled: Container[int] = ()):
+        self.precompiled = precompiled
+        """The ids of the function, method and constructor nodes which are already compiled, and so are left alone"""
 
     def visit_Program(self, node: ast.Program):
         for top_level in node.top_level:
             self.visit(top_level)
+        return node
 
-    def visit_Class(self, node: ast.Class):
-        for base in node.bases:
-            self.visit(base)
+    def visit_Import(self, node: ast.Import):
+        return node
+
+    def visit_GenericClass(self, node: ast.GenericClass):
+        # only the instantiations are resolved, and they share their body with the generic class
+        for implement in node.implements:
+            self.visit(implement)
+        return node
 
+    def visit_Class(self, node: ast.Class):
         for body_stmt in node.body:
             self.visit(body_stmt)
+        return node
 
     def visit_Attr(self, node: ast.Attr):
-        self.visit(node.type)
+        return node
 
     def visit_Method(self, node: ast.Method):
-        self.visit(node.ret)
-        for arg, type in node.args.items():
-            self.visit(type)
+        if id(node) not in self.precompiled:
+            node.body = self.visit_stmts(node.body)
+        return node
+
+    def visit_Constructor(self, node: ast.Constructor):
+        if id(node) not in self.precompiled:
+            node.body = self.visit_stmts(node.body)
+        return node
+
+    def visit_Function(self, node: ast.Function):
+        if id(node) not in self.precompiled:
+            node.body = self.visit_stmts(node.body)
+        return node
+
+    def visit_OverloadedFunction(self, node: ast.OverloadedFunction):
+        if id(node) not in self.precompiled:
+            for overload in node.overloads:
+                overload.body = self.visit_stmts(overload.body)
+        return node
+
+    def visit_stmts(self, stmts: List[ast.Stmt]) -> List[ast.Stmt]:
+        visited = []
+        for stmt in stmts:
+            stmt = self.visit(stmt)
+            if isinstance(stmt, ast.Block) and not stmt.stmts:
+                continue
+            visited.append(stmt)
+            if always_returns(stmt):
+                break
+        return visited
+
+    def visit_Block(self, node: ast.Block):
+        node.stmts = self.visit_stmts(node.stmts)
+        return node
+
+    def visit_IfStmt(self, node: ast.IfStmt):
+        node.cond = self.visit(node.cond)
+        cond = constant(node.cond)
+        if cond is None:
+            node.then_do = self.visit(node.then_do)
+            node.else_do = self.visit(node.else_do)
+            return node
+        elif cond:
+            return self.visit(node.then_do)
+        else:
+            return self.visit(node.else_do)
+
+    def visit_WhileStmt(self, node: ast.WhileStmt):
+        node.cond = self.visit(node.cond)
+        if constant(node.cond) == 0:
+            return ast.Block([])
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+
+        left, right = constant(node.left), constant(node.right)
+        if left is None or right is None:
+            return node
+
+        val = fold(node.op, left, right)
+        if val is None:
+            return node
+
+        literal = ast.Literal("num", str(val))
+        literal.place(node.line, node.pos)
+        literal.meta["ret"] = node.meta["ret"]
+        literal.meta["val"] = val
+        return literal
+
+    def visit_Grouping(self, node: ast.Grouping):
+        node.expr = self.visit(node.expr)
+        if isinstance(node.expr, ast.Literal):
+            return node.expr
+        return node
 
     def default(self, obj: ast.Node, *args, **kwargs):
-        for attr_name in dir(obj):
-            if isinstance(getattr(obj, attr_name), ast.Node):
-                self.visit(obj)
+        for node_field in fields(obj):
+            if node_field.name in ("line", "pos", "meta"):
+                continue
+            value = getattr(obj, node_field.name)
+            if isinstance(value, ast.Node):
+                setattr(obj, node_field.name, self.visit(value))
+            elif isinstance(value, list):
+                setattr(obj, node_field.name, [self.visit(item) if isinstance(item, ast.Node) else item
+                                                for item in value])
+        return obj
 
 
 def expand(tree: ast.Node) -> ast.Node:
     expander = Expander()
-    expander.visit(tree)
-    return tree
+    return expander.visit(tree)
@@ -0,0 +1,57 @@
+from typing import Iterable, Set, Tuple, Optional
+
+from dragon.common import cgen
+
+
+class ClassHierarchy:
+    """
+    The methods which are overridden below each class of a program, so that calls to methods which never are can be
+    made directly, rather than through the vtable of the object.
+    """
+    def __init__(self, classes: Iterable[cgen.ClassType] = ()):
+        self.overridden: Set[Tuple[str, str]] = set()
+        """The c name of each class and the name of each method which a class below it implements"""
+
+        # the std_files override some methods of the builtin classes in C, where their ClassTypes can't see
+        for cls in cgen.builtin_classes:
+            self.overridden.update((cls.name, name) for name in cls.members())
+        self.extend(classes)
+
+    def extend(self, classes: Iterable[cgen.ClassType]) -> Set[Tuple[str, str]]:
+        """
+        Returns:
+            Set[Tuple[str, str]]: The classes and methods which were not overridden before `classes` were added
+        """
+        added = set()
+        for cls in classes:
+            for path in cls.ancestors().values():
+                if len(path) == 1:
+                    continue
+                # compared by the function which implements them, as a method may be overridden by one which the class
+                # inherits from another base, rather than by its own
+                ancestor = path[-1]
+                for name, (member_path, _) in ancestor.members().items():
+                    if name not in member_path[-1].methods:
+                        continue
+                    key = (ancestor.name, name)
+                    if key not in self.overridden and cls.get_func_name(name) != ancestor.get_func_name(name):
+                        self.overridden.add(key)
+                        added.add(key)
+        return added
+
+    def direct_call(self, cls: cgen.ClassType, name: str) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: The c name of the function which a call of the method `name` on an object of type `cls`
+            always runs, or None if that depends on the class of the object
+        """
+        if (cls.name, name) in self.overridden:
+            return None
+        try:
+            path, _ = cls.members()[name]
+        except KeyError:
+            return None
+        if name not in path[-1].methods:
+            # an attribute holding a function, rather than a method
+            return None
+        return cls.get_func_name(name)
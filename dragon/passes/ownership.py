@@ -0,0 +1,145 @@
+from typing import Container, Dict, Iterable, List, Optional, Set
+
+from dragon.common import ast, cgen, Visitor
+
+
+def is_cast(node: ast.Expr) -> bool:
+    """
+    Returns:
+        bool: Whether `node` casts an object to another of its classes, which is the same object rather than a new one
+    """
+    return isinstance(node, ast.Cast) and cgen.is_cls(node.obj.meta["ret"]) and cgen.is_cls(node.meta["ret"])
+
+
+def borrows(node: ast.Expr) -> bool:
+    """
+    Returns:
+        bool: Whether `node` only reads a reference which something else holds, rather than creating an object
+    """
+    if isinstance(node, ast.GetVar):
+        return True
+    elif isinstance(node, ast.GetAttr):
+        return borrows(node.obj)
+    elif isinstance(node, ast.Grouping):
+        return borrows(node.expr)
+    elif is_cast(node):
+        return borrows(node.obj)
+    else:
+        return False
+
+
+def root(node: Optional[ast.Expr]) -> Optional[str]:
+    """
+    Returns:
+        Optional[str]: The c name of the variable which holds the object `node` evaluates to, if it is just a variable
+    """
+    while isinstance(node, ast.Grouping) or (node is not None and is_cast(node)):
+        node = node.expr if isinstance(node, ast.Grouping) else node.obj
+    if isinstance(node, ast.GetVar):
+        return node.meta["c_name"]
+    return None
+
+
+def in_scope(stmts: Iterable[ast.Stmt], visible: Set[str], found: Dict[int, Set[str]]):
+    """
+    Maps the id of each return of `stmts` in `found` to the c names of the locals declared before it, in its block
+    or the ones around it. The resolver doesn't give blocks scopes of their own, but C does.
+    """
+    visible = set(visible)
+    for stmt in stmts:
+        if isinstance(stmt, ast.VarStmt):
+            visible.add(stmt.meta["c_name"])
+        elif isinstance(stmt, ast.ReturnStmt):
+            found[id(stmt)] = visible
+        elif isinstance(stmt, ast.Block):
+            in_scope(stmt.stmts, visible, found)
+        elif isinstance(stmt, ast.IfStmt):
+            in_scope([stmt.then_do], visible, found)
+            in_scope([stmt.else_do], visible, found)
+        elif isinstance(stmt, ast.WhileStmt):
+            in_scope([stmt.body], visible, found)
+
+
+class Ownership(Visitor):
+    """
+    Decides which references each function owns, so that the compiler only counts those.
+
+    Objects are only ever freed when a reference to them is released, and that only happens at a return, to the
+    locals of the returning function. So parameters (and self) are borrowed from the caller, and so are locals
+    initialised by reading a reference held elsewhere which are never reassigned or returned: neither take or release
+    a reference. The other locals own one, which every return releases, except that a returned local gives its up
+    without deleting the object, as it is now the caller's.
+
+    Sets `meta["borrowed"]` on each VarStmt and `meta["decref"]` and `meta["release"]` on each ReturnStmt.
+    """
+    def __init__(self, precompiled: Container[int] = ()):
+        self.precompiled = precompiled
+        """The ids of the function, method and constructor nodes which are already compiled, and so are left alone"""
+
+    def visit_Program(self, node: ast.Program):
+        for top_level in node.top_level:
+            self.visit(top_level)
+        return node
+
+    def visit_Import(self, node: ast.Import):
+        return node
+
+    def visit_GenericClass(self, node: ast.GenericClass):
+        for implement in node.implements:
+            self.visit(implement)
+        return node
+
+    def visit_Class(self, node: ast.Class):
+        for body_stmt in node.body:
+            self.visit(body_stmt)
+        return node
+
+    def visit_Attr(self, node: ast.Attr):
+        return node
+
+    def visit_Method(self, node: ast.Method):
+        if id(node) not in self.precompiled:
+            self.analyse(node.body, {"self", *node.meta["args"]})
+        return node
+
+    def visit_Constructor(self, node: ast.Constructor):
+        if id(node) not in self.precompiled:
+            self.analyse(node.body, {"self", *node.meta["args"]})
+        return node
+
+    def visit_Function(self, node: ast.Function):
+        if id(node) not in self.precompiled:
+            self.analyse(node.body, set(node.meta["c args"]))
+        return node
+
+    def visit_OverloadedFunction(self, node: ast.OverloadedFunction):
+        if id(node) not in self.precompiled:
+            for overload in node.overloads:
+                self.analyse(overload.body, set(overload.meta["c args"]))
+        return node
+
+    @staticmethod
+    def analyse(body: List[ast.Stmt], params: Set[str]):
+        nodes = list(ast.walk(body))
+
+        reassigned = {node.meta["c_name"] for node in nodes if isinstance(node, ast.SetVar)}
+        returned = {root(node.expr) for node in nodes if isinstance(node, ast.ReturnStmt)}
+
+        borrowed = set(params)
+        for node in nodes:
+            if isinstance(node, ast.VarStmt):
+                c_name = node.meta["c_name"]
+                node.meta["borrowed"] = (cgen.is_cls(node.val.meta["ret"]) and borrows(node.val)
+                                         and c_name not in reassigned and c_name not in returned)
+                if node.meta["borrowed"]:
+                    borrowed.add(c_name)
+
+        visible = {}
+        in_scope(body, set(), visible)
+
+        for node in nodes:
+            if isinstance(node, ast.ReturnStmt):
+                owned = [c_name for c_name in node.meta["to delete"].objects().values()
+                         if c_name not in borrowed and c_name in visible[id(node)]]
+                node.meta["release"] = [c_name for c_name in owned if c_name == root(node.expr)]
+                node.meta["decref"] = [c_name for c_name in owned if c_name != root(node.expr)]
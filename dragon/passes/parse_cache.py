@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import sys
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Optional
+
+from dragon.common import ast
+from . import parser, scanner
+
+CACHE_VERSION = 2
+"""Part of every cache key, so that trees pickled by an older version of the parser are never loaded"""
+
+HEADER = b"DRGNCACHE" + CACHE_VERSION.to_bytes(4, "little") + bytes(sys.version_info[:2])
+"""Written before every pickled tree, so that files which this version didn't write are never unpickled"""
+
+
+def ast_fingerprint() -> str:
+    """
+    Returns:
+        str: The name, bases and fields of every class of node, so that trees pickled before any of them changed are
+        never loaded, even if the version wasn't bumped
+    """
+    classes = sorted((value for value in vars(ast).values() if isinstance(value, type) and issubclass(value, ast.Node)),
+                     key=lambda cls: cls.__name__)
+    return ";".join(f"{cls.__name__}({','.join(base.__name__ for base in cls.__bases__)})"
+                    f"[{','.join(node_field.name for node_field in fields(cls))}]" for cls in classes)
+
+
+AST_FINGERPRINT = ast_fingerprint()
+
+
+def default_directory() -> Path:
+    """
+    Returns:
+        Path: The folder in the user's own cache directory which the trees are cached in by default
+    """
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "dragon"
+
+
+@dataclass()
+class CacheStats:
+    hits: int = field(default=0)
+    misses: int = field(default=0)
+    evictions: int = field(default=0)
+    size: int = field(default=0)
+    """The total size in bytes of the cached trees, as of the last store"""
+
+
+class ParseCache:
+    """
+    A cache of parsed `Program` trees on disk, keyed by a hash of the source they were parsed from.
+
+    Each tree is pickled to its own file in `directory`, after a header identifying the version which wrote it. The
+    modification time of a file records when it was last used, and once the cache grows past `max_size` bytes the least
+    recently used trees are evicted.
+
+    The files are unpickled, so `directory` must only be writable by the user, which the default one is.
+    """
+    def __init__(self, directory: Path = None, max_size: int = 64 * 1024 * 1024):
+        self.directory = directory if directory is not None else default_directory()
+        self.max_size = max_size
+        self.stats = CacheStats()
+
+    @staticmethod
+    def key(text: str) -> str:
+        digest = hashlib.blake2b(str(CACHE_VERSION).encode("utf-8"), digest_size=20)
+        digest.update(AST_FINGERPRINT.encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def parse(self, text: str) -> ast.Program:
+        """
+        Returns:
+            ast.Program: The tree of `text`, loaded from the cache if `text` has been parsed before
+        """
+        path = self.directory / (self.key(text) + ".pickle")
+        program = self.load(path)
+        if program is not None:
+            self.stats.hits += 1
+            return program
+
+        self.stats.misses += 1
+        program = parser.parse(scanner.scan(text))
+        self.store(path, program)
+        return program
+
+    @staticmethod
+    def load(path: Path) -> Optional[ast.Program]:
+        """
+        Returns:
+            Optional[ast.Program]: The tree cached in `path`, or None if there isn't one or it can't be loaded
+        """
+        # a file left by another version may fail to unpickle in any number of ways, all of which are just a miss
+        try:
+            with path.open("rb") as file:
+                if file.read(len(HEADER)) != HEADER:
+                    return None
+                program = pickle.load(file)
+            os.utime(path)
+        except Exception:
+            return None
+        return program if isinstance(program, ast.Program) else None
+
+    def store(self, path: Path, program: ast.Program):
+        # the cache is only an optimization, so failing to write to it is not an error
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with temp_path.open("wb") as file:
+                file.write(HEADER)
+                pickle.dump(program, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        # besides PicklingError, pickle raises TypeError or AttributeError for the objects it can't pickle
+        except (OSError, pickle.PicklingError, RecursionError, TypeError, AttributeError):
+            return
+        finally:
+            # only still there if the tree couldn't be written or moved into place
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used trees until the cache fits in `max_size`"""
+        entries = []
+        for path in self.directory.glob("*.pickle"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries, key=lambda entry: entry[0]):
+            if size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            size -= entry_size
+            self.stats.evictions += 1
+        self.stats.size = size
+
+    def clear(self):
+        for path in self.directory.glob("*.pickle"):
+            path.unlink()
+        self.stats.size = 0
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from typing import List, Dict
+from array import array
+from dataclasses import dataclass, fields
+import hashlib
+from typing import List, Dict, Iterable, Tuple, Optional, Sequence, Set
 
 from dragon.common.dragon_ast import *
 
-from dragon.common import Token, DragonError
+from dragon.common import Token, TokenArray, DragonError
+from dragon.common.token import intern_kind, kind_names
 
 ORDER = "AFTER scanner"
 
@@ -13,43 +17,167 @@ class ParseError(DragonError):
     pass
 
 
+END = Token("\0", "\0", 0, (0, 0))
+"""The token a stream reports as current once it has run out of tokens"""
+
+# the kinds of token the parser looks for, compared as numbers rather than as their type strings
+CLASS, DEF, MACRO, ENDMACRO, IMPORT = map(intern_kind, ("class", "def", "macro", "endmacro", "import"))
+ATTR, METHOD, NEW, AS = map(intern_kind, ("attr", "method", "new", "as"))
+VAR, RETURN, IF, ELSE, WHILE, DEL = map(intern_kind, ("var", "return", "if", "else", "while", "del"))
+IDENT, META_IDENT, NUM, HEX, STR = map(intern_kind, ("ident", "$ident", "num", "hex", "str"))
+LPAREN, RPAREN, LBRACE, RBRACE, LT, GT = map(intern_kind, ("(", ")", "{", "}", "<", ">"))
+DOT, COMMA, SEMICOLON, COLON, ARROW, ASSIGN = map(intern_kind, (".", ",", ";", ":", "->", "="))
+MACRO_OPEN, MACRO_CLOSE, FAT_ARROW = map(intern_kind, ("$(", ")$", "=>"))
+
+
+class TokenBuffer:
+    """
+    The tokens shared by every `Stream` over the same source, addressed by their absolute index in the token stream.
+
+    A list of tokens or a `TokenArray` is used in place as a shared array. Any other iterable, such as the one returned
+    by `scan_iter`, is treated as a lookahead window: tokens are only pulled from it once a stream asks for them, and
+    tokens before the start of the window are forgotten by `release`.
+    """
+    def __init__(self, tokens: Iterable[Token]):
+        self.array = tokens if isinstance(tokens, TokenArray) else None
+        """The tokens, if they are a `TokenArray`, whose kinds and places are read without building a `Token`"""
+
+        self.kinds: Optional[array] = None
+        """The kinds of `array`, followed by the kind of `END`"""
+        if self.array is not None:
+            self.kinds = array('B', self.array.kinds)
+            self.kinds.append(END.kind)
+
+        if isinstance(tokens, (list, TokenArray)):
+            self.source = None
+            self.window: Sequence[Token] = tokens
+        else:
+            self.source = iter(tokens)
+            self.window: Sequence[Token] = []
+        self.start = 0
+        """The absolute index of the first token in the window"""
+
+    def kind(self, index: int) -> int:
+        """
+        Returns:
+            int: The kind of the token at the absolute index `index`, or the kind of `END`
+        """
+        if self.kinds is not None:
+            return self.kinds[index]
+        return self.get(index).kind
+
+    def place(self, index: int) -> Tuple[int, Tuple[int, int]]:
+        """
+        Returns:
+            The line and position of the token at the absolute index `index`, as given to `Node.place`
+        """
+        if self.kinds is not None and self.kinds[index] != END.kind:
+            return self.array.place(index)
+        token = self.get(index)
+        return token.line, token.pos
+
+    def get(self, index: int) -> Token:
+        """
+        Returns:
+            Token: The token at the absolute index `index`, or `END` if the stream has ended before it
+        """
+        offset = index - self.start
+        try:
+            return self.window[offset]
+        except IndexError:
+            if self.source is None:
+                return END
+        while offset >= len(self.window):
+            try:
+                self.window.append(next(self.source))
+            except StopIteration:
+                return END
+        return self.window[offset]
+
+    def release(self, index: int):
+        """Forgets every token before the absolute index `index`, which must never be read again"""
+        if self.source is not None:
+            del self.window[:index - self.start]
+            self.start = index
+
+
 class Stream:
-    def __init__(self, tokens: List[Token], macro_symbols: Dict[str, Dict[str, Node]] = None):
+    """
+    An immutable cursor into a `TokenBuffer`.
+
+    Streams are never changed in place: `advance` and `expect` return a new stream one token further on, which shares
+    the buffer of this one, so advancing is O(1) and earlier streams can still be read. A stream only reads the kind of
+    its current token, and builds the `Token` itself the first time `curr` is used.
+    """
+    def __init__(self, tokens: Iterable[Token], macro_symbols: Dict[str, Dict[str, Node]] = None, index: int = 0):
         if macro_symbols is None:
             macro_symbols = {"stmt": {}, "expr": {}}
         else:
             assert "stmt" in macro_symbols and "expr" in macro_symbols
-        self.tokens = tokens
+        if isinstance(tokens, TokenBuffer):
+            self.buffer = tokens
+        else:
+            self.buffer = TokenBuffer(tokens)
+        self.index = index
         self.macro_symbols = macro_symbols
 
+        self.kind: int = self.buffer.kind(index)
+        self._curr: Optional[Token] = None
+        self._place: Optional[Tuple[int, Tuple[int, int]]] = None
+
     @property
     def curr(self) -> Token:
-        try:
-            return self.tokens[0]
-        except IndexError:
-            return Token("\0", "\0", 0, (0, 0))
+        if self._curr is None:
+            self._curr = self.buffer.get(self.index)
+        return self._curr
+
+    def place(self) -> Tuple[int, Tuple[int, int]]:
+        """
+        Returns:
+            The line and position of the current token, as given to `Node.place`
+        """
+        if self._place is None:
+            self._place = self.buffer.place(self.index)
+        return self._place
 
     def advance(self):
-        return Stream(self.tokens[1:], self.macro_symbols), self.tokens[0]
+        if self.kind == END.kind:
+            raise self.error("Unexpected end of file")
+        return Stream(self.buffer, self.macro_symbols, self.index + 1), self.curr
+
+    def skip(self, kind: int):
+        """
+        Returns:
+            Stream: The stream after the current token, which must be of kind `kind`, like `expect` but without
+            building the token
+        """
+        if self.kind == kind:
+            return Stream(self.buffer, self.macro_symbols, self.index + 1)
+        else:
+            raise self.error(f"Expected a '{kind_names[kind]}' token, got a '{self.curr.type}' token instead")
 
-    def expect(self, typ: str):
-        if self.curr.type == typ:
+    def expect(self, kind: int):
+        if self.kind == kind:
             return self.advance()
         else:
-            raise self.error(f"Expected a '{typ}' token, got a '{self.curr.type}' token instead")
+            raise self.error(f"Expected a '{kind_names[kind]}' token, got a '{self.curr.type}' token instead")
 
     def error(self, msg):
-        raise ParseError(msg, self.curr.line, self.curr.pos)
+        raise ParseError(msg, *self.place())
 
     def is_empty(self):
-        return len(self.tokens) == 0
+        return self.kind == END.kind
+
+    def release(self):
+        """Lets the buffer forget every token before this stream, once no earlier stream will be used again"""
+        self.buffer.release(self.index)
 
 
 def parsing_method(func):
     def _wrapper(self, stream: Stream):
         new_stream, node = func(self, stream)
         if node is not None:
-            node.place(stream.curr.line, stream.curr.pos)
+            node.place(*stream.place())
         return new_stream, node
     return _wrapper
 
@@ -58,20 +186,111 @@ def static_parsing_method(func):
     def _wrapper(stream: Stream):
         new_stream, node = func(stream)
         if node is not None:
-            node.place(stream.curr.line, stream.curr.pos)
+            node.place(*stream.place())
         return new_stream, node
 
     return _wrapper
 
 
+binary_precedence = {
+    intern_kind(op): precedence for op, precedence in {
+        "==": 1, "!=": 1,
+        "<": 2, ">": 2, "<=": 2, ">=": 2,
+        "+": 3, "-": 3,
+        "*": 4, "/": 4, "//": 4, "%": 4,
+    }.items()
+}
+"""The kinds of the binary operators, mapped to how tightly they bind (higher binds tighter)"""
+
+prefix_ops = {intern_kind("!"), intern_kind("-")}
+
+literal_kinds = {NUM, HEX, STR}
+
+
+@dataclass()
+class MacroHole(Expr):
+    """Stands for the argument `name` of a macro, parsed by the rule `rule`, inside the macro's template"""
+    name: str
+    rule: str
+
+
+class TemplateError(Exception):
+    """
+    Raised when the replacement of a macro can't be parsed without knowing its arguments. The only such case is an
+    assignment to a hole, which depends on whether the argument is a variable, an attribute, or neither: every other
+    rule only looks at the tokens of the replacement
+    """
+
+
+def substitute(node: Node, symbols: Dict[str, Dict[str, Node]], copies: Dict[int, Node]) -> Node:
+    """
+    Returns:
+        Node: A copy of the template `node`, with every `MacroHole` replaced by its argument in `symbols`.
+        Arguments are not copied, and nodes which appear more than once in the template are copied only once
+    """
+    if isinstance(node, MacroHole):
+        return symbols[node.rule][node.name]
+    if id(node) in copies:
+        return copies[id(node)]
+
+    copy = copies[id(node)] = node.__class__.__new__(node.__class__)
+    for name, value in node.__dict__.items():
+        if name == "meta":
+            value = {}
+        elif isinstance(value, Node):
+            value = substitute(value, symbols, copies)
+        elif isinstance(value, list):
+            value = [substitute(item, symbols, copies) if isinstance(item, Node) else item for item in value]
+        elif isinstance(value, dict):
+            value = {key: substitute(item, symbols, copies) if isinstance(item, Node) else item
+                     for key, item in value.items()}
+        setattr(copy, name, value)
+    return copy
+
+
 class Macro:
-    def __init__(self, start: str, call: List[Token], replace: List[Token]):
+    def __init__(self, start: str, call: List[Token], replace: List[Token], rule: str):
         self.start = start
         self.call = call
         self.replace = replace
+        self.rule = rule
+        """Whether the replacement is a stmt or an expr"""
+
+        self.template: Optional[Node] = None
+        """The replacement parsed once, with a `MacroHole` for each argument, or None if it must be parsed each use"""
+
+        self.template_version = -1
+        """The `Parser.macro_version` the template was parsed with, as it may use other macros"""
+
+    def holes(self) -> Dict[str, Dict[str, Node]]:
+        holes = {"stmt": {}, "expr": {}}
+        for n, call_token in enumerate(self.call[:-2]):
+            if call_token.kind == META_IDENT and self.call[n + 1].kind == COLON and self.call[n + 2].kind == IDENT:
+                rule = self.call[n + 2].text
+                if rule in holes:
+                    holes[rule][call_token.text] = MacroHole(call_token.text, rule)
+        return holes
+
+    def expand(self, parser: Parser, symbols: Dict[str, Dict[str, Node]]) -> Node:
+        """
+        Returns:
+            Node: The replacement of this macro, with its arguments `symbols` substituted in
+        """
+        if self.template_version != parser.macro_version:
+            self.template_version = parser.macro_version
+            try:
+                self.template = getattr(parser, "parse_" + self.rule)(Stream(self.replace, self.holes()))[1]
+            except TemplateError:
+                self.template = None
+
+        if self.template is None:
+            return getattr(parser, "parse_" + self.rule)(Stream(self.replace, symbols))[1]
+        # expansions aren't cached by the ids of their arguments: each use parses new arguments, and the later passes
+        # annotate and rewrite the nodes of each expansion in place, so no two uses could share one
+        return substitute(self.template, symbols, {})
 
     def apply(self, parser: Parser, stream: Stream):
-        # stream, start = stream.expect("ident")
+        # stream, start = stream.expect(IDENT)
         # assert start.text == self.start
 
         def get_else(li, ind, default=None):
@@ -93,7 +312,7 @@ class Macro:
                 type = call_token.type[1:]
                 if type == "ident":
                     if (get_else(self.call, n + 1) and get_else(self.call, n + 2)
-                            and self.call[n + 1].type == ":" and self.call[n + 2].type == "ident"):
+                            and self.call[n + 1].kind == COLON and self.call[n + 2].kind == IDENT):
                         rule = self.call[n + 2].text
                         ident = call_token.text
                         # ident, rule = call_token.text.split(" ")
@@ -107,9 +326,7 @@ class Macro:
                 else:
                     raise Exception()
 
-        macro_tokens = self.replace
-        macro_stream = Stream(macro_tokens, symbols)
-        return stream, macro_stream
+        return stream, self.expand(parser, symbols)
 
 
 class Parser:
@@ -118,6 +335,8 @@ class Parser:
             "stmt": {},
             "expr": {}
         }
+        self.macro_version = 0
+        """Counts the macros defined so far, so that macro templates know when they might need to be parsed again"""
 
     def parse_program(self, stream: Stream) -> Program:
         top_levels = []
@@ -125,80 +344,84 @@ class Parser:
             stream, top_level = self.parse_top_level(stream)
             if top_level is not None:
                 top_levels.append(top_level)
+            # Every top level statement has been parsed, so only the tokens after it will be read from now on
+            stream.release()
         program = Program(top_levels)
         program.place(0, (0, 0))
         return program
 
     @parsing_method
     def parse_top_level(self, stream: Stream) -> (Stream, TopLevel):
-        if stream.curr.type == 'class':
+        if stream.kind == CLASS:
             return self.parse_class(stream)
-        elif stream.curr.type == 'def':
+        elif stream.kind == DEF:
             return self.parse_function(stream)
-        elif stream.curr.type == 'macro':
+        elif stream.kind == MACRO:
             stream = self.parse_macro(stream)
             return stream, None
-        elif stream.curr.type == "import":
+        elif stream.kind == IMPORT:
             return self.parse_import(stream)
         else:
             raise stream.error(f"Cannot parse a top level statement from a '{stream.curr.type}' token")
 
     @parsing_method
     def parse_import(self, stream: Stream):
-        stream, _ = stream.expect("import")
-        stream, file = stream.expect("str")
+        stream = stream.skip(IMPORT)
+        stream, file = stream.expect(STR)
         return stream, Import(file.text[1:-1])
 
     def parse_macro(self, stream: Stream) -> Stream:
-        stream, _ = stream.expect("macro")
+        stream = stream.skip(MACRO)
 
         macro_call = []
 
-        stream, _ = stream.expect("$(")
-        stream, start = stream.expect("ident")
+        stream = stream.skip(MACRO_OPEN)
+        stream, start = stream.expect(IDENT)
         macro_call.append(start)
-        while stream.curr.type != ")$":
+        while stream.kind != MACRO_CLOSE:
             stream, token = stream.advance()
             macro_call.append(token)
-        stream, _ = stream.expect(")$")
+        stream = stream.skip(MACRO_CLOSE)
 
-        stream, _ = stream.expect("=>")
-        stream, ret_token = stream.expect("ident")
+        stream = stream.skip(FAT_ARROW)
+        stream, ret_token = stream.expect(IDENT)
         place = ret_token.text
-        stream, _ = stream.expect(":")
+        stream = stream.skip(COLON)
 
         macro_replace = []
 
-        stream, _ = stream.expect("$(")
-        while stream.curr.type != ")$":
+        stream = stream.skip(MACRO_OPEN)
+        while stream.kind != MACRO_CLOSE:
             stream, token = stream.advance()
             macro_replace.append(token)
-        stream, _ = stream.expect(")$")
+        stream = stream.skip(MACRO_CLOSE)
 
-        macro = Macro(start.text, macro_call, macro_replace)
+        macro = Macro(start.text, macro_call, macro_replace, place)
 
         self.macros[place][macro.start] = macro
+        self.macro_version += 1
 
-        stream, _ = stream.expect("endmacro")
+        stream = stream.skip(ENDMACRO)
 
         return stream
 
     @staticmethod
-    def arguments(start: str, stream: Stream, each, end: str, sep: str = ",") -> (Stream, List):
+    def arguments(start: int, stream: Stream, each, end: int, sep: Optional[int] = COMMA) -> (Stream, List):
+        """Parses `each` between the kinds `start` and `end`, separated by the kind `sep`, or by nothing if it's None"""
         args = []
-        stream, _ = stream.expect(start)
+        stream = stream.skip(start)
         while True:
-            if stream.curr.type == end:
+            if stream.kind == end:
                 break
             stream, arg = each(stream)
             args.append(arg)
-            if stream.curr.type == sep:
-                stream, _ = stream.advance()
-            elif sep == '':
+            if stream.kind == sep:
+                stream = stream.skip(sep)
+            elif sep is None:
                 pass
             else:
                 break
-        stream, _ = stream.expect(end)
+        stream = stream.skip(end)
         return stream, args
 
     @parsing_method
@@ -208,54 +431,54 @@ class Parser:
     @parsing_method
     def parse_generic(self, stream: Stream):
         stream, type = self.parse_dotted_name(stream)
-        while stream.curr.type == "<":
-            stream, args = self.arguments("<", stream, self.parse_type, ">")
+        while stream.kind == LT:
+            stream, args = self.arguments(LT, stream, self.parse_type, GT)
             type = Generic(type, args)
         return stream, type
 
     @parsing_method
     def parse_dotted_name(self, stream: Stream):
         stream, type = self.parse_name(stream)
-        while stream.curr.type == ".":
-            stream, _ = stream.expect(".")
-            stream, attr = stream.expect("ident")
+        while stream.kind == DOT:
+            stream = stream.skip(DOT)
+            stream, attr = stream.expect(IDENT)
             type = GetName(type, attr.text)
         return stream, type
 
     @parsing_method
     def parse_name(self, stream: Stream):
-        stream, name = stream.expect("ident")
+        stream, name = stream.expect(IDENT)
         type = Name(name.text)
         return stream, type
 
     @parsing_method
     def parse_function(self, stream: Stream):
-        stream, _ = stream.expect("def")
-        stream, name = stream.expect("ident")
+        stream = stream.skip(DEF)
+        stream, name = stream.expect(IDENT)
 
         def parse_parameter(s: Stream):
-            s, param_name = s.expect("ident")
-            s, _ = s.expect(":")
+            s, param_name = s.expect(IDENT)
+            s = s.skip(COLON)
             s, typ = self.parse_type(s)
             return s, (param_name.text, typ)
 
         def parse_tail(s: Stream):
-            s, arg_tuples = self.arguments("(", s, parse_parameter, ")")
+            s, arg_tuples = self.arguments(LPAREN, s, parse_parameter, RPAREN)
             args = dict(arg_tuples)
-            if s.curr.type == "->":
-                s, _ = s.expect("->")
+            if s.kind == ARROW:
+                s = s.skip(ARROW)
                 s, ret = self.parse_type(s)
             else:
                 ret = None
             body = []
-            s, _ = s.expect("{")
-            while not s.curr.type == "}":
+            s = s.skip(LBRACE)
+            while not s.kind == RBRACE:
                 s, stmt = self.parse_stmt(s)
                 body.append(stmt)
-            s, _ = s.expect("}")
+            s = s.skip(RBRACE)
             return s, (args, ret, body)
 
-        if stream.curr.type == "(":  # regular function:
+        if stream.kind == LPAREN:  # regular function:
             stream, init_args = parse_tail(stream)
             return stream, Function(name.text, *init_args)
         else:
@@ -264,41 +487,41 @@ class Parser:
                 s, overload_args = parse_tail(s)
                 return s, Overload(*overload_args)
 
-            stream, overloads = self.arguments("{", stream, parse_overload, "}", sep='')
+            stream, overloads = self.arguments(LBRACE, stream, parse_overload, RBRACE, sep=None)
             return stream, OverloadedFunction(name.text, overloads)
 
     @parsing_method
     def parse_class(self, stream: Stream) -> (Stream, Class):
-        stream, _ = stream.expect("class")
-        stream, name_token = stream.expect("ident")
+        stream = stream.skip(CLASS)
+        stream, name_token = stream.expect(IDENT)
         name = name_token.text
 
-        if stream.curr.type == "<":
-            stream, type_vars = self.arguments("<", stream, self.parse_name, ">")
+        if stream.kind == LT:
+            stream, type_vars = self.arguments(LT, stream, self.parse_name, GT)
             type_vars = [type_var.name for type_var in type_vars]
         else:
             type_vars = []
 
-        if stream.curr.type == "(":
-            stream, bases = self.arguments("(", stream, self.parse_type, ")")
+        if stream.kind == LPAREN:
+            stream, bases = self.arguments(LPAREN, stream, self.parse_type, RPAREN)
         else:
             bases = []
 
         body = []
-        stream, _ = stream.expect("{")
-        while not stream.curr.type == "}":
-            if stream.curr.type == "attr":
+        stream = stream.skip(LBRACE)
+        while not stream.kind == RBRACE:
+            if stream.kind == ATTR:
                 stream, attr = self.parse_attr(stream)
                 body.append(attr)
-            elif stream.curr.type == "method":
+            elif stream.kind == METHOD:
                 stream, method = self.parse_method(stream)
                 body.append(method)
-            elif stream.curr.type == "new":
+            elif stream.kind == NEW:
                 stream, constructor = self.parse_constructor(stream)
                 body.append(constructor)
             else:
                 raise stream.error(f"Class body must contain only attrs, methods, and constructors")
-        stream, _ = stream.expect("}")
+        stream = stream.skip(RBRACE)
         if type_vars:
             # noinspection PyArgumentList
             return stream, GenericClass(name, bases, body, type_vars)
@@ -307,84 +530,83 @@ class Parser:
 
     @parsing_method
     def parse_attr(self, stream: Stream) -> (Stream, Attr):
-        stream, _ = stream.expect("attr")
-        stream, name_token = stream.expect("ident")
+        stream = stream.skip(ATTR)
+        stream, name_token = stream.expect(IDENT)
         name = name_token.text
-        if stream.curr.type == ":":
-            stream, _ = stream.expect(":")
+        if stream.kind == COLON:
+            stream = stream.skip(COLON)
             stream, type = self.parse_type(stream)
         else:
             type = None
-        stream, _ = stream.expect(";")
+        stream = stream.skip(SEMICOLON)
         return stream, Attr(name, type)
 
     @parsing_method
     def parse_method(self, stream: Stream) -> (Stream, Method):
-        stream, _ = stream.expect("method")
-        stream, name = stream.expect("ident")
+        stream = stream.skip(METHOD)
+        stream, name = stream.expect(IDENT)
 
         def parse_parameter(s: Stream):
-            s, param_name = s.expect("ident")
-            s, _ = s.expect(":")
+            s, param_name = s.expect(IDENT)
+            s = s.skip(COLON)
             s, typ = self.parse_type(s)
             return s, (param_name.text, typ)
 
-        stream, arg_tuples = self.arguments("(", stream, parse_parameter, ")")
+        stream, arg_tuples = self.arguments(LPAREN, stream, parse_parameter, RPAREN)
         args = dict(arg_tuples)
-        if stream.curr.type == "->":
-            stream, _ = stream.expect("->")
+        if stream.kind == ARROW:
+            stream = stream.skip(ARROW)
             stream, ret = self.parse_type(stream)
         else:
             ret = None
         body = []
-        stream, _ = stream.expect("{")
-        while not stream.curr.type == "}":
+        stream = stream.skip(LBRACE)
+        while not stream.kind == RBRACE:
             stream, stmt = self.parse_stmt(stream)
             body.append(stmt)
-        stream, _ = stream.expect("}")
+        stream = stream.skip(RBRACE)
         return stream, Method(name.text, args=args, ret=ret, body=body)
 
     @parsing_method
     def parse_constructor(self, stream: Stream):
-        stream, _ = stream.expect("new")
+        stream = stream.skip(NEW)
 
         def parse_parameter(s: Stream):
-            s, param_name = s.expect("ident")
-            s, _ = s.expect(":")
+            s, param_name = s.expect(IDENT)
+            s = s.skip(COLON)
             s, typ = self.parse_type(s)
             return s, (param_name.text, typ)
 
-        stream, arg_tuples = self.arguments("(", stream, parse_parameter, ")")
+        stream, arg_tuples = self.arguments(LPAREN, stream, parse_parameter, RPAREN)
         args = dict(arg_tuples)
         body = []
-        stream, _ = stream.expect("{")
-        while not stream.curr.type == "}":
+        stream = stream.skip(LBRACE)
+        while not stream.kind == RBRACE:
             stream, stmt = self.parse_stmt(stream)
             body.append(stmt)
-        stream, _ = stream.expect("}")
+        stream = stream.skip(RBRACE)
         return stream, Constructor(args, body)
 
     @parsing_method
     def parse_stmt(self, stream: Stream) -> (Stream, Stmt):
-        if stream.curr.type == "var":
+        if stream.kind == VAR:
             return self.parse_var_stmt(stream)
-        elif stream.curr.type == "return":
+        elif stream.kind == RETURN:
             return self.parse_return_stmt(stream)
-        elif stream.curr.type == "if":
+        elif stream.kind == IF:
             return self.parse_if_stmt(stream)
-        elif stream.curr.type == "while":
+        elif stream.kind == WHILE:
             return self.parse_while_stmt(stream)
-        elif stream.curr.type == "{":
+        elif stream.kind == LBRACE:
             return self.parse_block(stream)
-        elif stream.curr.type == "ident" and stream.curr.text in self.macros["stmt"]:
+        elif stream.kind == IDENT and stream.curr.text in self.macros["stmt"]:
             macro = self.macros["stmt"][stream.curr.text]
-            stream, macro_stream = macro.apply(self, stream)
-            return stream, self.parse_stmt(macro_stream)[1]
-        elif stream.curr.type == "$ident" and stream.curr.text in stream.macro_symbols["stmt"]:
+            return macro.apply(self, stream)
+        elif stream.kind == META_IDENT and stream.curr.text in stream.macro_symbols["stmt"]:
             # if stream.curr.text in stream.macro_symbols["stmt"]:
             stream, ident = stream.advance()
             return stream, stream.macro_symbols["stmt"][ident.text]
-        elif stream.curr.type == "del":
+        elif stream.kind == DEL:
             return self.parse_delete(stream)
         # else:
         #     raise stream.error(f"Statement meta-identifier {stream.curr.text} is not defined")
@@ -393,30 +615,30 @@ class Parser:
 
     @parsing_method
     def parse_delete(self, stream: Stream):
-        stream, _ = stream.expect("del")
+        stream = stream.skip(DEL)
         stream, obj = self.parse_expr(stream)
-        stream, _ = stream.expect(";")
+        stream = stream.skip(SEMICOLON)
         return stream, DeleteStmt(obj)
 
     @parsing_method
     def parse_block(self, stream: Stream):
-        stream, _ = stream.expect("{")
+        stream = stream.skip(LBRACE)
         body = []
-        while not stream.curr.type == "}":
+        while not stream.kind == RBRACE:
             stream, stmt = self.parse_stmt(stream)
             body.append(stmt)
-        stream, _ = stream.expect("}")
+        stream = stream.skip(RBRACE)
         return stream, Block(body)
 
     @parsing_method
     def parse_if_stmt(self, stream: Stream):
-        stream, _ = stream.expect("if")
-        stream, _ = stream.expect("(")
+        stream = stream.skip(IF)
+        stream = stream.skip(LPAREN)
         stream, cond = self.parse_expr(stream)
-        stream, _ = stream.expect(")")
+        stream = stream.skip(RPAREN)
         stream, then_do = self.parse_stmt(stream)
-        if stream.curr.type == 'else':
-            stream, _ = stream.expect("else")
+        if stream.kind == ELSE:
+            stream = stream.skip(ELSE)
             stream, else_do = self.parse_stmt(stream)
         else:
             else_do = Block([])
@@ -424,172 +646,275 @@ class Parser:
 
     @parsing_method
     def parse_while_stmt(self, stream: Stream):
-        stream, _ = stream.expect("while")
-        stream, _ = stream.expect("(")
+        stream = stream.skip(WHILE)
+        stream = stream.skip(LPAREN)
         stream, cond = self.parse_expr(stream)
-        stream, _ = stream.expect(")")
+        stream = stream.skip(RPAREN)
         stream, body = self.parse_stmt(stream)
         return stream, WhileStmt(cond, body)
 
     @parsing_method
     def parse_var_stmt(self, stream: Stream):
-        stream, _ = stream.expect("var")
-        stream, var = stream.expect("ident")
+        stream = stream.skip(VAR)
+        stream, var = stream.expect(IDENT)
 
-        stream, _ = stream.expect(":")
+        stream = stream.skip(COLON)
 
         stream, typ = self.parse_type(stream)
 
-        if stream.curr.type == "=":
-            stream, _ = stream.expect("=")
+        if stream.kind == ASSIGN:
+            stream = stream.skip(ASSIGN)
             stream, val = self.parse_expr(stream)
         else:
             val = None
-        stream, _ = stream.expect(";")
+        stream = stream.skip(SEMICOLON)
         return stream, VarStmt(var.text, typ, val)
 
     @parsing_method
     def parse_return_stmt(self, stream: Stream):
-        stream, _ = stream.expect("return")
-        if stream.curr.type == ";":
-            stream, _ = stream.expect(";")
+        stream = stream.skip(RETURN)
+        if stream.kind == SEMICOLON:
+            stream = stream.skip(SEMICOLON)
             # noinspection PyTypeChecker
             return stream, ReturnStmt(None)
         stream, expr = self.parse_expr(stream)
-        stream, _ = stream.expect(";")
+        stream = stream.skip(SEMICOLON)
         return stream, ReturnStmt(expr)
 
     @parsing_method
     def parse_expr_stmt(self, stream: Stream):
         stream, expr = self.parse_expr(stream)
-        stream, _ = stream.expect(";")
+        stream = stream.skip(SEMICOLON)
         return stream, ExprStmt(expr)
 
     @parsing_method
     def parse_expr(self, stream: Stream):
-        # if stream.curr.type == "ident":
+        # if stream.kind == IDENT:
         #     var = stream.curr.text
         #     if var in self.macros["expr"]:
         #         macro = self.macros["expr"][var]
         #         stream, macro_stream = macro.apply(self, stream)
         #         return stream, self.parse_expr(macro_stream)[1]
 
-        return self.parse_assignment(stream)
-
-    @parsing_method
-    def parse_assignment(self, stream: Stream):
-        stream, expr = self.parse_equality(stream)
-        if stream.curr.type == "=":
+        stream, expr = self.parse_binary(stream, 0)
+        if stream.kind == ASSIGN:
             if isinstance(expr, GetVar):
-                stream, _ = stream.expect("=")
-                stream, right = self.parse_assignment(stream)
+                stream = stream.skip(ASSIGN)
+                stream, right = self.parse_expr(stream)
                 expr = SetVar(expr.var, right)
             elif isinstance(expr, GetAttr):
-                stream, _ = stream.expect("=")
-                stream, right = self.parse_assignment(stream)
+                stream = stream.skip(ASSIGN)
+                stream, right = self.parse_expr(stream)
                 expr = SetAttr(expr.obj, expr.attr, right)
+            elif isinstance(expr, MacroHole):
+                # whether this is an assignment depends on the argument
+                raise TemplateError()
             else:
                 stream.error(f"Left-hand side of an assignment must be a variable or attribute")
 
         return stream, expr
 
-    def parse_bin_op(self, stream: Stream, ops: List[str], lower) -> (Stream, Expr):
-        stream, expr = lower(stream)
-        while stream.curr.type in ops:
-            start = stream.curr.line, stream.curr.pos
+    def parse_binary(self, stream: Stream, min_precedence: int) -> (Stream, Expr):
+        """
+        Parses a chain of binary operators by precedence climbing, using `binary_precedence`.
+
+        Only operators which bind at least as tightly as `min_precedence` are consumed, so the right-hand side of an
+        operator is parsed with a `min_precedence` one higher than its own, which makes every operator left-associative.
+        """
+        stream, expr = self.parse_operand(stream)
+        while True:
+            precedence = binary_precedence.get(stream.kind)
+            if precedence is None or precedence < min_precedence:
+                return stream, expr
+            start = stream.place()
             stream, op = stream.advance()
-            stream, right = lower(stream)
+            stream, right = self.parse_binary(stream, precedence + 1)
             expr = BinOp(left=expr, op=op.text, right=right)
             expr.place(*start)
-        return stream, expr
-
-    @parsing_method
-    def parse_equality(self, stream: Stream) -> (Stream, BinOp):
-        return self.parse_bin_op(stream, ["==", "!="], self.parse_comparison)
-
-    @parsing_method
-    def parse_comparison(self, stream: Stream) -> (Stream, BinOp):
-        return self.parse_bin_op(stream, ["<", ">", "<=", ">="], self.parse_addition)
-
-    @parsing_method
-    def parse_addition(self, stream: Stream) -> (Stream, BinOp):
-        return self.parse_bin_op(stream, ["+", "-"], self.parse_multiplication)
-
-    @parsing_method
-    def parse_multiplication(self, stream: Stream) -> (Stream, BinOp):
-        return self.parse_bin_op(stream, ["*", "/", "//", "%"], self.parse_cast)
-
-    @parsing_method
-    def parse_cast(self, stream: Stream):
-        stream, expr = self.parse_unary(stream)
-        while stream.curr.type == "as":
-            start = stream.curr.line, stream.curr.pos
-            stream, _ = stream.expect("as")
-            stream, typ = self.parse_type(stream)
-            expr = Cast(expr, typ)
-            expr.place(*start)
-        return stream, expr
 
-    @parsing_method
-    def parse_unary(self, stream: Stream) -> (Stream, Unary):
-        if stream.curr.type in ("!", "-"):
+    def parse_operand(self, stream: Stream) -> (Stream, Expr):
+        """Parses a primary expression, along with its prefix operators, calls, attribute accesses and casts"""
+        prefixes = []
+        while stream.kind in prefix_ops:
+            start = stream.place()
             stream, op = stream.advance()
-            stream, right = self.parse_unary(stream)
-            return Unary(op.text, right)
-        else:
-            return self.parse_call(stream)
+            prefixes.append((op.text, start))
 
-    @parsing_method
-    def parse_call(self, stream: Stream):
+        start = stream.place()
         stream, expr = self.parse_primary(stream)
-        while not stream.is_empty():
-            start = stream.curr.line, stream.curr.pos
-            if stream.curr.type == "(":
-                stream, args = self.arguments("(", stream, self.parse_expr, ")")
+        expr.place(*start)
+
+        while True:
+            start = stream.place()
+            if stream.kind == LPAREN:
+                stream, args = self.arguments(LPAREN, stream, self.parse_expr, RPAREN)
                 expr = Call(expr, args)
-            elif stream.curr.type == ".":
-                stream, _ = stream.expect(".")
-                stream, attr = stream.expect("ident")
+            elif stream.kind == DOT:
+                stream = stream.skip(DOT)
+                stream, attr = stream.expect(IDENT)
                 expr = GetAttr(expr, attr.text)
             else:
                 break
             expr.place(*start)
+
+        for op, start in reversed(prefixes):
+            expr = Unary(op, expr)
+            expr.place(*start)
+
+        while stream.kind == AS:
+            start = stream.place()
+            stream = stream.skip(AS)
+            stream, typ = self.parse_type(stream)
+            expr = Cast(expr, typ)
+            expr.place(*start)
         return stream, expr
 
-    @parsing_method
     def parse_primary(self, stream: Stream):
-        if stream.curr.type == "ident":
+        if stream.kind == IDENT:
             if stream.curr.text in self.macros["expr"]:
                 macro = self.macros["expr"][stream.curr.text]
-                stream, macro_stream = macro.apply(self, stream)
-                return stream, self.parse_expr(macro_stream)[1]
+                return macro.apply(self, stream)
             stream, var = stream.advance()
             return stream, GetVar(var.text)
-        elif stream.curr.type == "$ident":
+        elif stream.kind == META_IDENT:
             if stream.curr.text in stream.macro_symbols["expr"]:
                 stream, ident = stream.advance()
                 return stream, stream.macro_symbols["expr"][ident.text]
             else:
                 raise stream.error(f"Expression meta-identifier {stream.curr.text} is not defined")
-        elif stream.curr.type in ("num", "hex", "str"):
-            type = stream.curr.type
+        elif stream.kind in literal_kinds:
             stream, literal = stream.advance()
             # noinspection PyTypeChecker
-            return stream, Literal(type, literal.text)
-        elif stream.curr.type == "(":
-            stream, _ = stream.expect("(")
+            return stream, Literal(literal.type, literal.text)
+        elif stream.kind == LPAREN:
+            stream = stream.skip(LPAREN)
             stream, expr = self.parse_expr(stream)
-            stream, _ = stream.expect(")")
+            stream = stream.skip(RPAREN)
             return stream, Grouping(expr)
-        elif stream.curr.type == "new":
-            stream, _ = stream.expect("new")
+        elif stream.kind == NEW:
+            stream = stream.skip(NEW)
             stream, cls = self.parse_type(stream)
-            stream, args = self.arguments("(", stream, self.parse_expr, ")")
+            stream, args = self.arguments(LPAREN, stream, self.parse_expr, RPAREN)
             return stream, New(cls, args)
         else:
             stream.error(f"Expected Expression, got {stream.curr.type}")
 
 
-def parse(tokens: List[Token]):
+def parse(tokens: Iterable[Token]):
     parser = Parser()
     return parser.parse_program(Stream(tokens))
+
+
+def top_level_end(kinds: Sequence[int], start: int) -> int:
+    """
+    Guesses where the top level statement starting at `start` ends, without parsing it.
+
+    Returns:
+        int: The index of the token after the statement, assuming braces are balanced within it
+    """
+    if kinds[start] == IMPORT:
+        return start + 2
+    elif kinds[start] == MACRO:
+        for index in range(start, len(kinds)):
+            if kinds[index] == ENDMACRO:
+                return index + 1
+        return len(kinds)
+    depth = 0
+    for index in range(start, len(kinds)):
+        if kinds[index] == LBRACE:
+            depth += 1
+        elif kinds[index] == RBRACE:
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return len(kinds)
+
+
+def move_lines(node: Node, delta: int, first: int, last: int, moved: set = None):
+    """Adds `delta` to the line of every node in `node` which was placed between the lines `first` and `last`"""
+    if moved is None:
+        moved = set()
+    if id(node) in moved:
+        return
+    moved.add(id(node))
+
+    if hasattr(node, "line") and first <= node.line <= last:
+        node.line += delta
+    for node_field in fields(node):
+        if node_field.name in ("line", "pos", "meta", "implements"):
+            continue
+        value = getattr(node, node_field.name)
+        if isinstance(value, dict):
+            value = value.values()
+        elif not isinstance(value, list):
+            value = [value]
+        for child in value:
+            if isinstance(child, Node):
+                move_lines(child, delta, first, last, moved)
+
+
+class IncrementalParser:
+    """
+    Parses successive versions of the same source, reusing the nodes of the top level statements which haven't changed.
+
+    Each top level statement is fingerprinted by its text, the position of its first token within its line, and the
+    macros defined before it. A statement whose fingerprint was also parsed in the previous version is not parsed again:
+    its node is reused, with its line numbers moved to where the statement now starts. Reused nodes are therefore shared
+    with the `Program` returned for the previous version. Each node is reused at most once per version, so identical
+    statements after the first are parsed again.
+    """
+    def __init__(self):
+        self.parsed: Dict[bytes, Tuple[int, int, Optional[TopLevel]]] = {}
+        """Maps the fingerprint of each top level statement of the previous version to its first line, last line and
+        node"""
+
+        self.reused = 0
+        """How many top level statements the last call to `parse` reused"""
+
+    @staticmethod
+    def fingerprint(tokens: TokenArray, start: int, end: int, macros: bytes) -> bytes:
+        text = tokens.source[tokens.starts[start]:tokens.ends[end - 1]]
+        digest = hashlib.blake2b(macros, digest_size=16)
+        digest.update(tokens.columns[start].to_bytes(4, "little"))
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+    def parse(self, tokens: TokenArray) -> Program:
+        parser = Parser()
+        buffer = TokenBuffer(tokens)
+        kinds = tokens.kinds
+
+        parsed = {}
+        reused: Set[bytes] = set()
+        top_levels = []
+        # the fingerprint and line of the last macro definition, which covers every macro definition before it
+        macros = b""
+        self.reused = 0
+
+        index = 0
+        while index < len(tokens):
+            end = top_level_end(kinds, index)
+            key = self.fingerprint(tokens, index, end, macros)
+            if key in self.parsed and key not in reused and kinds[index] != MACRO:
+                old_first, old_last, top_level = self.parsed[key]
+                first = tokens.lines[index]
+                if first != old_first:
+                    move_lines(top_level, first - old_first, old_first, old_last)
+                reused.add(key)
+                self.reused += 1
+            else:
+                stream, top_level = parser.parse_top_level(Stream(buffer, None, index))
+                end = stream.index
+                key = self.fingerprint(tokens, index, end, macros)
+                if top_level is None:
+                    macros = key + tokens.lines[index].to_bytes(4, "little")
+
+            parsed[key] = tokens.lines[index], tokens.lines[end - 1], top_level
+            if top_level is not None:
+                top_levels.append(top_level)
+            index = end
+
+        self.parsed = parsed
+        program = Program(top_levels)
+        program.place(0, (0, 0))
+        return program
@@ -3,10 +3,11 @@ from __future__ import annotations
 import itertools
 import pathlib
 from dataclasses import dataclass
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Hashable, Optional
 
-from dragon.common import cgen, ast, DragonError, Visitor, MutableDict
+from dragon.common import cgen, ast, DragonError, Visitor
 from . import parser, scanner
+from .parse_cache import ParseCache
 
 
 class ResolvingError(DragonError):
@@ -28,6 +29,70 @@ class Module:
         # TODO: Copy modules too?
 
 
+class SymbolTable:
+    """
+    The names visible from one scope (the active scope), shared by every Environment created from the same root.
+
+    Each name maps to a stack of bindings, one for each scope on the active chain which declares it, so the innermost
+    binding is always on top. Activating another scope pops the scopes which are not its ancestors, and pushes the
+    ones which are, so moving between a scope and its children only costs the names they declare.
+    """
+    def __init__(self):
+        self.chain: List[Environment] = []
+        """The active scope and its ancestors, outermost first, so each scope is at the index of its level"""
+
+        self.vars: Dict[str, List[VarMeta]] = {}
+        self.types: Dict[str, List[cgen.Type]] = {}
+        self.modules: Dict[str, List[Module]] = {}
+
+    def activate(self, env: Environment):
+        level = 0
+        while level < len(self.chain) and level < len(env.chain) and self.chain[level] is env.chain[level]:
+            level += 1
+        self.truncate(level)
+        for scope in env.chain[level:]:
+            self.push(scope)
+
+    def truncate(self, level: int):
+        """Pops every active scope at `level` or deeper"""
+        while len(self.chain) > level:
+            scope = self.chain.pop()
+            for table, names in ((self.vars, scope.vars), (self.types, scope.types), (self.modules, scope.modules)):
+                for name in names:
+                    bindings = table[name]
+                    bindings.pop()
+                    if not bindings:
+                        del table[name]
+
+    def push(self, scope: Environment):
+        self.chain.append(scope)
+        for table, names in ((self.vars, scope.vars), (self.types, scope.types), (self.modules, scope.modules)):
+            for name, value in names.items():
+                table.setdefault(name, []).append(value)
+
+    def is_active(self, env: Environment):
+        return len(self.chain) > env.level and self.chain[env.level] is env
+
+
+class Locals:
+    """The variables declared in a function up to a point of it, such as a return statement"""
+    def __init__(self, env: Environment):
+        self.env = env
+        self.count = len(env.frame.declared)
+
+    def objects(self) -> Dict[str, str]:
+        """
+        Returns:
+            Dict[str, str]: Maps the name of each local which holds an object to its c name
+        """
+        # a redeclared name keeps the place of its first declaration, but takes the type and c name of the last one
+        latest: Dict[str, VarMeta] = {}
+        for scope, name, meta in itertools.islice(self.env.frame.declared, self.count):
+            if scope.level < len(self.env.chain) and self.env.chain[scope.level] is scope:
+                latest[name] = meta
+        return {name: meta.c_name for name, meta in latest.items() if cgen.is_cls(meta.type)}
+
+
 class Environment:
     def __init__(self, vars: Dict[str, cgen.Type], types: Dict[str, cgen.Type], name: str = None,
                  parent: 'Environment' = None):
@@ -38,26 +103,69 @@ class Environment:
         self.parent = parent
         if parent is None:
             self.count = itertools.count()
+            self.table = SymbolTable()
+            self.chain: Tuple[Environment, ...] = (self,)
         else:
             self.count = parent.count
+            self.table = parent.table
+            self.chain: Tuple[Environment, ...] = parent.chain + (self,)
+        self.level = len(self.chain) - 1
 
         if name is None:
             self.name = self.next("scope")
         else:
             self.name = name
 
+        if parent is None or self.name.startswith("func "):
+            self.frame = self
+        else:
+            self.frame = parent.frame
+        """The scope of the function this scope is in, whose locals are deleted when it returns"""
+
+        self.local_count = itertools.count()
+        """If this scope is a frame, the counter which numbers the locals of its function"""
+
+        self.declared: List[Tuple[Environment, str, VarMeta]] = []
+        """If this scope is a frame, the scope, name and meta of each variable declared within it, in order"""
+        self.frame.declared.extend((self, var, meta) for var, meta in self.vars.items())
+
     def next(self, name: str):
         return name + "_" + str(next(self.count))
 
+    def next_local(self, name: str):
+        """
+        Returns:
+            str: A c name for a local of the function of this scope. It is numbered by the function's own counter, so
+            it doesn't depend on the order functions are resolved in, and the "l" keeps it apart from names from `next`
+        """
+        if self.frame.parent is None:
+            # not in a function, so the name is a global
+            return self.next(name)
+        return name + "_l" + str(next(self.frame.local_count))
+
+    def declare(self, names: Dict[str, object], table: Dict[str, list], name: str, value):
+        if self.table.is_active(self):
+            if self.table.chain[-1] is not self:
+                # the bindings of deeper scopes sit above this one's, so pop them and push them again when needed
+                self.table.truncate(self.level + 1)
+            bindings = table.setdefault(name, [])
+            if name in names:
+                bindings[-1] = value
+            else:
+                bindings.append(value)
+        names[name] = value
+
     def new_var(self, name: str, type: cgen.Type, builtin=False, c_name=''):
         if builtin:
             if c_name:
-                self.vars[name] = VarMeta(c_name, type)
+                meta = VarMeta(c_name, type)
             else:
-                self.vars[name] = VarMeta(name, type)
+                meta = VarMeta(name, type)
         else:
-            self.vars[name] = VarMeta(self.next(name), type)
-        return self.vars[name].c_name
+            meta = VarMeta(self.next_local(name), type)
+        self.declare(self.vars, self.table.vars, name, meta)
+        self.frame.declared.append((self, name, meta))
+        return meta.c_name
 
     def extend_vars(self, names: Dict[str, cgen.Type], builtin=False, c_names=None):
         if c_names is None:
@@ -68,48 +176,60 @@ class Environment:
         return [self.new_var(name, type, builtin, c_name) for (name, type), c_name in zip(names.items(), c_names)]
 
     def new_type(self, name: str, type: cgen.Type):
-        self.types[name] = type
+        self.declare(self.types, self.table.types, name, type)
+
+    def new_module(self, name: str, module: Module):
+        self.declare(self.modules, self.table.modules, name, module)
 
     def new_scope(self, name: str = None) -> Tuple[Environment, Environment]:
         return self, Environment({}, {}, name, parent=self)
 
+    def lookup(self, table: Dict[str, list], name: str):
+        if not self.table.chain or self.table.chain[-1] is not self:
+            self.table.activate(self)
+        try:
+            return table[name][-1]
+        except KeyError:
+            raise KeyError(name) from None
+
     def get_var(self, name: str) -> VarMeta:
-        if name in self.vars:
-            return self.vars[name]
-        else:
-            if self.parent:
-                return self.parent.get_var(name)
-            else:
-                raise KeyError(name)
+        return self.lookup(self.table.vars, name)
 
     def get_type(self, name: str) -> cgen.Type:
-        if name in self.types:
-            return self.types[name]
-        else:
-            if self.parent:
-                return self.parent.get_type(name)
-            else:
-                raise KeyError(name)
+        return self.lookup(self.table.types, name)
 
     def get_module(self, name: str) -> Module:
-        if name in self.modules:
-            return self.modules[name]
-        else:
-            if self.parent:
-                return self.parent.get_module(name)
-            else:
-                raise KeyError(name)
+        return self.lookup(self.table.modules, name)
 
-    def func_vars(self) -> Dict[str, VarMeta]:
-        def add_dict(d1, d2):
-            d3 = d1.copy()
-            d3.update(d2)
-            return d3
+    def func_locals(self) -> Locals:
+        """
+        Returns:
+            Locals: The variables declared so far in the function of this scope
+        """
+        return Locals(self)
 
-        if self.name.startswith("func "):
-            return add_dict(self.vars, {})
-        else:
-            return add_dict(self.parent.func_vars(), self.vars)
+
+class ModuleGraph:
+    """Every module of a compilation, keyed by the resolved path of its file, and the imports between them"""
+    def __init__(self):
+        self.modules: Dict[pathlib.Path, Tuple[ast.Program, Module]] = {}
+        """Maps the path of each module which has been resolved to its tree and its Module"""
+
+        self.imports: Dict[pathlib.Path, List[pathlib.Path]] = {}
+        """Maps the path of each module to the paths of the modules it imports"""
+
+        self.generics: Dict[Tuple[Hashable, ...], cgen.ClassType] = {}
+        """Maps the type key of a generic class followed by those of its type arguments to the one class which
+        instantiates it, wherever in the program it is used"""
+
+        self.resolving: List[pathlib.Path] = []
+        """The modules currently being resolved, each imported by the one before it"""
+
+    def add_import(self, importer: pathlib.Path, imported: pathlib.Path, node: ast.Import):
+        if imported in self.resolving:
+            cycle = self.resolving[self.resolving.index(imported):] + [imported]
+            raise ResolvingError(f"Circular import: {' -> '.join(path.name for path in cycle)}", node.line, node.pos)
+        self.imports.setdefault(importer, []).append(imported)
 
 
 def inherited_methods(cls_type: cgen.ClassType):
@@ -118,7 +238,7 @@ def inherited_methods(cls_type: cgen.ClassType):
 
 
 class Resolver(Visitor):
-    def __init__(self):
+    def __init__(self, parse_cache: Optional[ParseCache] = None):
         self.names: Environment = Environment(
             {
                 "print": cgen.SingleFuncType([cgen.Object], cgen.Void, "print"),
@@ -142,6 +262,44 @@ class Resolver(Visitor):
 
         self.MODULE_MODE = False
 
+        self.graph = ModuleGraph()
+
+        self.classes: List[cgen.ClassType] = []
+        """Every class of the program, including the instantiations of generic classes, in the order resolved"""
+
+        self.parse_cache = parse_cache
+        """Where the trees of imported files are parsed from, or None to always parse them again"""
+
+        self.deferred: Optional[List[Tuple[ast.Node, Environment]]] = None
+        """If not None, the bodies of functions, methods and constructors are not resolved when they are visited, but
+        appended here with the scope they are in, so they can be resolved later (and independently) by `resolve_body`"""
+
+    def defer(self, node: ast.Node) -> bool:
+        """
+        Returns:
+            bool: Whether the body of `node` is deferred, rather than to be resolved now
+        """
+        if self.deferred is None:
+            return False
+        self.deferred.append((node, self.names))
+        return True
+
+    def resolve_body(self, node: ast.Node, scope: Environment, index: int):
+        """
+        Resolves the body of `node`, which was the `index`th deferred, in `scope`.
+
+        The names the body needs from `scope` are numbered by a counter of its own, with the index in them to keep them
+        apart from every other body's, so they are the same whichever bodies were resolved before it, and in which
+        process.
+        """
+        old_scope, deferred, count = self.names, self.deferred, scope.count
+        self.names, self.deferred = scope, None
+        scope.count = (f"{index}b{n}" for n in itertools.count())
+        try:
+            self.visit(node)
+        finally:
+            self.names, self.deferred, scope.count = old_scope, deferred, count
+
     def visit_Name(self, node: ast.Name):
         if self.MODULE_MODE:
             return self.names.get_module(node.name)
@@ -159,11 +317,12 @@ class Resolver(Visitor):
 
         # TODO: check type of args
 
-        arg_names = tuple(arg.name for arg in args)
+        key = (cgen.type_key(type),) + tuple(cgen.type_key(arg) for arg in args)
         try:
-            generic = type.generics[arg_names]
-            return generic
+            return self.graph.generics[key]
         except KeyError:
+            arg_names = [arg.name if isinstance(arg, cgen.ClassType) else arg.as_type() for arg in args]
+
             gen_cls_node: ast.GenericClass = type.node
             cls_name = self.names.next(gen_cls_node.name + '__' + '_'.join(arg_names))
             cls_node = ast.Class(cls_name, gen_cls_node.bases, gen_cls_node.body)
@@ -182,13 +341,14 @@ class Resolver(Visitor):
             cls_node.meta["type"] = cls_type
             cls_node.meta["c_name"] = c_name
 
+            # registered before its body is resolved, so that the body can refer to this same instantiation
+            self.graph.generics[key] = cls_type
+            gen_cls_node.implements.append(cls_node)
+
             self.visit_Class(cls_node)
 
             self.names: Environment = old_scope
 
-            gen_cls_node.implements.append(cls_node)
-            type.generics[arg_names] = cls_type
-
             return cls_type
 
     def visit_GetName(self, node: ast.GetName):
@@ -200,7 +360,11 @@ class Resolver(Visitor):
             self.MODULE_MODE = False
             return module.types[node.name]
 
-    def visit_Program(self, node: ast.Program):
+    def visit_Program(self, node: ast.Program, path: pathlib.Path = None):
+        if path is not None:
+            path = path.resolve()
+        self.graph.resolving.append(path)
+
         modules_wide, new_scope = self.names.new_scope("globals")
         self.names: Environment = new_scope
 
@@ -219,16 +383,16 @@ class Resolver(Visitor):
                 # noinspection PyUnresolvedReferences
                 top_level.meta["ret"] = type.ret
             elif isinstance(top_level, ast.OverloadedFunction):
-                overloads = MutableDict([])
+                overloads: Dict[cgen.Signature, str] = {}
                 for n, overload in enumerate(top_level.overloads):
-                    overload_type = ({arg: self.visit(typ) for arg, typ in overload.args.items()},
-                                     self.visit(overload.ret))
+                    signature = cgen.Signature({arg: self.visit(typ) for arg, typ in overload.args.items()},
+                                               self.visit(overload.ret))
                     c_name = self.names.next(top_level.name + "_" + str(n))
-                    overloads[overload_type] = c_name
+                    overloads[signature] = c_name
                     overload.meta["c_name"] = c_name
                     overload.meta["n"] = n
-                    overload.meta["args"] = overload_type[0]
-                    overload.meta["ret"] = overload_type[1]
+                    overload.meta["args"] = dict(signature.args)
+                    overload.meta["ret"] = signature.ret
                 type = cgen.OverloadedFuncType(overloads)
                 self.names.new_var(top_level.name, type)
                 top_level.meta["type"] = type
@@ -237,6 +401,7 @@ class Resolver(Visitor):
             elif isinstance(top_level, ast.GenericClass):
                 c_name = self.names.next(top_level.name)
                 type = cgen.GenericClassType(c_name, top_level.type_vars, top_level, self.names)
+                top_level.implements.clear()  # the node may be left over from an earlier resolution
                 self.names.new_type(top_level.name, type)
                 top_level.meta["type"] = type
                 top_level.meta["c_name"] = c_name
@@ -248,18 +413,27 @@ class Resolver(Visitor):
                 top_level.meta["type"] = type
                 top_level.meta["c_name"] = c_name
             elif isinstance(top_level, ast.Import):
-                this_scope = self.names
-                self.names: Environment = modules_wide
-
                 file_path = pathlib.Path(top_level.file)
-                with open(file_path, "r") as file_obj:
-                    file = file_obj.read()
-                parsed = parser.parse(scanner.scan(file))
-                module_scope = self.visit_Program(parsed)
-
-                self.names: Environment = this_scope
-                module = Module(module_scope)
-                self.names.modules[file_path.with_suffix('').name] = module
+                module_path = file_path.resolve()
+                self.graph.add_import(path, module_path, top_level)
+
+                if module_path not in self.graph.modules:
+                    this_scope = self.names
+                    self.names: Environment = modules_wide
+
+                    with open(file_path, "r") as file_obj:
+                        file = file_obj.read()
+                    if self.parse_cache is not None:
+                        parsed = self.parse_cache.parse(file)
+                    else:
+                        parsed = parser.parse(scanner.scan(file))
+                    module_scope = self.visit_Program(parsed, module_path)
+
+                    self.names: Environment = this_scope
+                    self.graph.modules[module_path] = parsed, Module(module_scope)
+
+                parsed, module = self.graph.modules[module_path]
+                self.names.new_module(file_path.with_suffix('').name, module)
                 top_level.meta["module"] = module
                 top_level.meta["path"] = file_path
                 top_level.meta["program"] = parsed
@@ -271,6 +445,7 @@ class Resolver(Visitor):
 
         curr_scope = self.names
         self.names = modules_wide
+        self.graph.resolving.pop()
         return curr_scope
 
     def visit_Import(self, node: ast.Import):
@@ -281,6 +456,7 @@ class Resolver(Visitor):
 
     def visit_Class(self, node: ast.Class):
         cls_type: cgen.ClassType = node.meta["type"]
+        self.classes.append(cls_type)
         node.meta["has_constructor"] = False
 
         if len(node.bases) == 0:
@@ -290,7 +466,7 @@ class Resolver(Visitor):
             if isinstance(body_stmt, ast.Attr):
                 type = self.visit(body_stmt.type)
 
-                cls_type.attrs[body_stmt.name] = type
+                cls_type.add_attr(body_stmt.name, type)
 
                 body_stmt.meta["type"] = type
             elif isinstance(body_stmt, ast.Method):
@@ -302,7 +478,7 @@ class Resolver(Visitor):
                 type = cgen.SingleFuncType(args, ret, c_name)
 
                 if not cls_type.has_name(body_stmt.name):
-                    cls_type.methods[body_stmt.name] = type
+                    cls_type.add_method(body_stmt.name, type)
                 cls_type.func_names[body_stmt.name] = c_name
 
                 body_stmt.meta["cls"] = cls_type
@@ -320,7 +496,7 @@ class Resolver(Visitor):
                 c_name = self.names.next(node.name + "_new")
                 type = cgen.SingleFuncType(args, ret, c_name)
 
-                cls_type.other["new"] = type
+                cls_type.add_other("new", type)
                 cls_type.func_names["new"] = c_name
 
                 body_stmt.meta["cls"] = cls_type
@@ -333,20 +509,26 @@ class Resolver(Visitor):
             else:
                 raise Exception(body_stmt)
 
+        cls_type.finalize()
+
+        if not node.meta["has_constructor"]:
+            cls_type.func_names["new"] = "new_" + node.meta["c_name"]
+
+        # the methods of user classes are found through vtables, but the std_files expect the methods of the builtin
+        # classes to be stored in each object, so they are set when it is created (through a redirect if inherited)
         node.meta["inherited methods"] = {}
-        node.meta["all methods"] = {}
+        node.meta["builtin methods"] = {}
 
         for inherited in inherited_methods(cls_type):
+            path, _ = cls_type.members()[inherited]
+            if inherited in node.meta["builtin methods"] or not cgen.is_builtin(path[-1]):
+                continue
             if inherited in cls_type.func_names:
                 c_name = cls_type.func_names[inherited]
             else:
                 c_name = self.names.next(node.meta["c_name"] + "_redirect_" + inherited)
                 node.meta["inherited methods"][inherited] = c_name
-            node.meta["all methods"][inherited] = c_name
-
-        for method in cls_type.methods.keys():
-            if method not in node.meta["inherited methods"]:
-                node.meta["all methods"][method] = cls_type.func_names[method]
+            node.meta["builtin methods"][inherited] = c_name
 
         for body_stmt in node.body:
             self.visit(body_stmt)
@@ -355,6 +537,9 @@ class Resolver(Visitor):
         pass
 
     def visit_Method(self, node: ast.Method):
+        if self.defer(node):
+            return
+
         type = node.meta["type"]
 
         old_scope, new_scope = self.names.new_scope(f"func {node.name}")
@@ -376,6 +561,9 @@ class Resolver(Visitor):
         #         raise ResolvingError(f"Expected return of {type.ret}, got a possible {ret}", node.line, node.pos)
 
     def visit_Constructor(self, node: ast.Constructor):
+        if self.defer(node):
+            return
+
         type = node.meta["type"]
 
         old_scope, new_scope = self.names.new_scope("func new")
@@ -397,6 +585,9 @@ class Resolver(Visitor):
         else:
             node.meta["is main"] = not True
 
+        if self.defer(node):
+            return
+
         type = node.meta["type"]
         returns = []
 
@@ -413,6 +604,9 @@ class Resolver(Visitor):
         # TODO: Return validation
 
     def visit_OverloadedFunction(self, node: ast.OverloadedFunction):
+        if self.defer(node):
+            return
+
         type = node.meta["type"]
         for overload in node.overloads:
             returns = []
@@ -461,7 +655,7 @@ class Resolver(Visitor):
 
     def visit_DeleteStmt(self, node: ast.DeleteStmt):
         self.visit(node.obj)
-        node.meta["temp"] = self.names.next("temp")
+        node.meta["temp"] = self.names.next_local("temp")
         return []
 
     def visit_ExprStmt(self, node: ast.ExprStmt):
@@ -469,9 +663,7 @@ class Resolver(Visitor):
         return []
 
     def visit_ReturnStmt(self, node: ast.ReturnStmt):
-        to_delete = {name: typ.c_name for name, typ in self.names.func_vars().items() if
-                     cgen.is_cls(typ.type)}
-        node.meta["to delete"] = to_delete
+        node.meta["to delete"] = self.names.func_locals()
         return [self.visit(node.expr)]
 
     def visit_GetVar(self, node: ast.GetVar):
@@ -524,9 +716,16 @@ class Resolver(Visitor):
     def visit_Call(self, node: ast.Call):
         passed = [self.visit(arg) for arg in node.args]
         func_type: cgen.FuncType = self.visit(node.callee)
-        ret = func_type.ret_for(passed)
         if not cgen.is_func_ptr(func_type):
             raise ResolvingError(f"Callee must be a function, not a {func_type}", node.callee.line, node.callee.pos)
+        try:
+            ret = func_type.ret_for(passed)
+        except cgen.AmbiguousOverloadError as e:
+            candidates = ", ".join(f"({', '.join(map(str, args))})" for args, _, _ in e.overloads)
+            raise ResolvingError(f"Call is ambiguous between the overloads taking {candidates}", node.line, node.pos)
+        except KeyError:
+            raise ResolvingError(f"No overload can be called with ({', '.join(map(str, passed))})",
+                                 node.line, node.pos)
 
         node.meta["func"] = func_type
         node.meta["args"] = passed
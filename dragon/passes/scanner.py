@@ -1,9 +1,9 @@
-from dataclasses import dataclass, field
-from typing import List
+from typing import Iterator, Tuple
 
 import re
 
-from dragon.common import DragonError, Token
+from dragon.common import DragonError, Token, TokenArray
+from dragon.common.token import intern_kind, kind_names
 
 ORDER = "START"
 
@@ -51,120 +51,109 @@ digits = "0123456789"
 v = 3
 
 
-class ExtendedString(str):
-    def __getitem__(self, item):
-        try:
-            return super().__getitem__(item)
-        except IndexError:
-            return "\0"
-
-
-@dataclass()
-class State:
-    pos: int = field(default=0)
-    line: int = field(default=1)
-    line_pos: int = field(default=0)
-
-
-def scan(text: str) -> List[Token]:
-    tokens = []
-    state = State()
-
-    macro_mode = False
-
-    text = ExtendedString(text)
-
-    def advance(num):
-        state.pos += num
-        state.line_pos += num
-
-    def advance_line():
-        state.pos += 1
-        state.line += 1
-        state.line_pos = 0
-
-    def expect(s):
-        if text[state.pos:state.pos + len(s)] == s:
-            advance(len(s))
-        else:
-            raise ScanningError(f"Expected {s!r}, got {text[state.pos:state.pos + len(s)]!r}", state.line,
-                                (state.line_pos, state.line_pos + len(s)))
-
-    def next_is(s):
-        if text[state.pos:state.pos + len(s)] == s:
-            return True
-        else:
-            return False
-
-    def add_if_match(s):
-        if text[state.pos:state.pos + len(s)] == s:
-            # print(s, True)
-            tokens.append(Token(s, s, state.line, (state.line_pos, state.line_pos + len(s))))
-            advance(len(s))
-            return True
-        else:
-            # print(s, False)
-            return False
-
-    def add_regex(pattern, name):
-        match_ = re.match(pattern, text[state.pos:]).group()
-        tokens.append(Token(name, match_, state.line, (state.line_pos, state.line_pos + len(match_))))
-        advance(len(match_))
-
-    while state.pos < len(text):
-        if macro_mode and any(add_if_match(basic_token) for basic_token in macro_basic_tokens):
+def _token_pattern(macro_mode: bool):
+    """
+    Builds the master pattern used by `scan`, with one named group per kind of lexeme.
+
+    Alternatives are tried left to right, so the basic tokens are listed longest first (as in `basic_tokens`) and the
+    macro tokens come before them when in macro mode.
+    """
+    ops = macro_basic_tokens + basic_tokens if macro_mode else basic_tokens
+    groups = [
+        ("op", "|".join(re.escape(op) for op in ops)),
+        ("hex", r"0x[A-Fa-f0-9]+"),
+        ("num", r"[0-9]+(?:\.[0-9]+)?"),
+        ("str", r'"(?:\\.|[^"\\])*"'),
+        ("ident", r"[_a-zA-Z][_a-zA-Z0-9]*"),
+        ("space", r" +"),
+        ("newline", r"\n"),
+        ("hash", r"#\S*"),
+    ]
+    if macro_mode:
+        groups.append(("meta", r"\$[_a-zA-Z][_a-zA-Z0-9]*"))
+    return re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in groups))
+
+
+token_pattern = _token_pattern(macro_mode=False)
+macro_token_pattern = _token_pattern(macro_mode=True)
+
+op_kinds = {op: intern_kind(op) for op in macro_basic_tokens + basic_tokens}
+keyword_kinds = {keyword: intern_kind(keyword) for keyword in keywords}
+hashcode_kinds = {hashcode: intern_kind(hashcode) for hashcode in ("macro", "endmacro", "import")}
+literal_kinds = {literal: intern_kind(literal) for literal in ("num", "hex", "str")}
+IDENT = intern_kind("ident")
+META_IDENT = intern_kind("$ident")
+
+
+def scan_spans(text: str) -> Iterator[Tuple[int, int, int, int, int]]:
+    """
+    Lazily scans `text`, yielding each token as soon as it has been read.
+
+    Each token is yielded as a tuple of its kind (see `intern_kind`), the start and end offsets of its text within
+    `text`, its line, and the position of its start within that line. Scanning errors are raised when the offending
+    token is reached, so a consumer such as the parser can start working before the whole of `text` has been scanned.
+    """
+    pos = 0
+    line = 1
+    line_start = 0  # the index in `text` at which the current line starts
+
+    pattern = token_pattern
+    end = len(text)
+
+    while pos < end:
+        match = pattern.match(text, pos)
+        if match is None:
+            line_pos = pos - line_start
+            if text.startswith('"', pos):
+                raise ScanningError("Unterminated string", line, (line_pos, line_pos + 1))
+            raise ScanningError(f"Cannot scan tokens from {text[pos]}", line, (line_pos, line_pos + 1))
+
+        kind = match.lastgroup
+        match_end = match.end()
+
+        if kind == "op":
+            yield op_kinds[match.group()], pos, match_end, line, pos - line_start
+        elif kind == "ident":
+            yield keyword_kinds.get(match.group(), IDENT), pos, match_end, line, pos - line_start
+        elif kind == "space":
             pass
-        elif any(add_if_match(basic_token) for basic_token in basic_tokens):
-            pass
-        else:   # Not a basic token
-            # start = line_pos
-            if text[state.pos:state.pos + 2] == "0x":
-                add_regex("0x[A-Fa-f0-9]+", "hex")
-            elif text[state.pos] in digits:
-                add_regex(r"[0-9]+(?:\.[0-9]+)?", "num")
-            elif text[state.pos] == "\"":
-                add_regex(r'"(?:\\.|[^"\\])*"', "str")
-            elif text[state.pos] in letters:
-                match = re.match("[_a-zA-Z][_a-zA-Z0-9]*", text[state.pos:]).group()
-                if match in keywords:
-                    tokens.append(Token(match, match, state.line, (state.line_pos, state.line_pos + len(match))))
-                else:
-                    tokens.append(Token("ident", match, state.line, (state.line_pos, state.line_pos + len(match))))
-                advance(len(match))
-            elif text[state.pos] == " ":
-                advance(1)
-            elif text[state.pos] == "\n":
-                advance_line()
-            elif text[state.pos] == "#":  # '#' used for special directives
-                hashcode = text[state.pos:].split(None, 1)[0][1:]
-                advance(1)
-                if hashcode == "":       # '# ' is a comment
-                    while text[state.pos] != "\n":
-                        advance(1)
-                    advance_line()
-                elif hashcode == "macro":
-                    macro_mode = True
-                    tokens.append(Token("macro", "macro", state.line, (state.line_pos, state.line_pos + len("macro"))))
-                    expect("macro")
+        elif kind == "newline":
+            line += 1
+            line_start = match_end
+        elif kind == "str" or kind == "num" or kind == "hex":
+            yield literal_kinds[kind], pos, match_end, line, pos - line_start
+        elif kind == "hash":  # '#' used for special directives
+            hashcode = match.group()[1:]
+            if hashcode == "":  # '# ' is a comment
+                newline = text.find("\n", match_end)
+                if newline == -1:
+                    break
+                line += 1
+                match_end = line_start = newline + 1
+            elif hashcode in hashcode_kinds:
+                yield hashcode_kinds[hashcode], pos + 1, match_end, line, pos + 1 - line_start
+                if hashcode == "macro":
+                    pattern = macro_token_pattern
                 elif hashcode == "endmacro":
-                    macro_mode = False
-                    tokens.append(
-                        Token("endmacro", "endmacro", state.line, (state.line_pos, state.line_pos + len("endmacro"))))
-                    expect("endmacro")
-                elif hashcode == "import":
-                    tokens.append(
-                        Token("import", "import", state.line, (state.line_pos, state.line_pos + len("import"))))
-                    advance(len("import"))
-                else:
-                    raise ScanningError(f"Unknown hashcode: {hashcode}", state.line,
-                                        (state.line_pos, state.line_pos + len(hashcode)))
-            elif macro_mode and text[state.pos] == "$" and text[state.pos + 1] in letters:
-                start = state.line_pos
-                match = re.match(r"\$[_a-zA-Z][_a-zA-Z0-9]*", text[state.pos:]).group()
-                advance(len(match))
-                tokens.append(Token("$ident", match, state.line, (start, state.line_pos)))
+                    pattern = token_pattern
             else:
-                raise ScanningError(f"Cannot scan tokens from {text[state.pos]}", state.line,
-                                    (state.line_pos, state.line_pos + 1))
+                line_pos = pos + 1 - line_start
+                raise ScanningError(f"Unknown hashcode: {hashcode}", line, (line_pos, line_pos + len(hashcode)))
+        elif kind == "meta":
+            yield META_IDENT, pos, match_end, line, pos - line_start
+
+        pos = match_end
+
+
+def scan_iter(text: str) -> Iterator[Token]:
+    """Lazily scans `text` like `scan_spans`, but yields each token as a `Token`"""
+    for kind, start, end, line, column in scan_spans(text):
+        yield Token(kind_names[kind], text[start:end], line, (column, column + end - start), kind)
+
 
+def scan(text: str) -> TokenArray:
+    tokens = TokenArray(text)
+    append = tokens.append
+    for kind, start, end, line, column in scan_spans(text):
+        append(kind, start, end, line, column)
     return tokens
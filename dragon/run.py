@@ -2,9 +2,10 @@ import os
 from pathlib import Path
 
 from dragon.passes import compile_drgn, parse, scan
+from dragon.passes.parse_cache import ParseCache
 from dragon.common import DragonError
 
-__all__ = ['run_file', 'compile_file',
+__all__ = ['run_file', 'compile_file', 'check_file',
            'Path']
 
 
@@ -12,12 +13,27 @@ class CompilingError(DragonError):
     pass
 
 
-def compile_file(path: Path, compiler='clang', delete_c=True):
+def check_file(path: Path, jobs=1):
+    """
+    Resolves and compiles `path` and the files it imports, to check that it is a valid program, but stops before
+    generating any C. No .c or .h files are written and the C compiler is never run.
+    """
     with path.open("r") as file:
         contents = file.read()
 
     try:
-        unit = compile_drgn(parse(scan(contents)), path)
+        compile_drgn(parse(scan(contents)), path, jobs=jobs)
+    except DragonError as e:
+        e.finish('<string>', contents)
+        raise
+
+
+def compile_file(path: Path, compiler='clang', delete_c=True, jobs=1, parse_cache: ParseCache = None):
+    with path.open("r") as file:
+        contents = file.read()
+
+    try:
+        unit = compile_drgn(parse(scan(contents)), path, parse_cache=parse_cache, jobs=jobs)
     except DragonError as e:
         e.finish('<string>', contents)
         raise
@@ -31,10 +47,11 @@ def compile_file(path: Path, compiler='clang', delete_c=True):
     c_files = Path(os.path.realpath(__file__)).parent / "std_files"
     dragon_c = str(c_files / "dragon.c")
     list_c = str(c_files / "list.c")
+    alloc_c = str(c_files / "alloc.c")
 
     result = os.system(f"{compiler} -O3 -o {path.with_suffix('')} "
                        f"{' '.join(str(program.path.with_suffix('.c')) for program in unit.programs)} "
-                       f"{dragon_c} {list_c} "
+                       f"{dragon_c} {list_c} {alloc_c} "
                        f"-Wno-parentheses-equality")
 
     if result != 0:
@@ -46,12 +63,12 @@ def compile_file(path: Path, compiler='clang', delete_c=True):
             program.path.with_suffix(".h").unlink()
 
 
-def run_file(path: Path, compiler='clang', delete_c=True, delete_exe=True):
+def run_file(path: Path, compiler='clang', delete_c=True, delete_exe=True, jobs=1, parse_cache: ParseCache = None):
     with path.open("r") as file:
         contents = file.read()
 
     try:
-        unit = compile_drgn(parse(scan(contents)), path)
+        unit = compile_drgn(parse(scan(contents)), path, parse_cache=parse_cache, jobs=jobs)
     except DragonError as e:
         e.finish('<string>', contents)
         raise
@@ -65,10 +82,11 @@ def run_file(path: Path, compiler='clang', delete_c=True, delete_exe=True):
     c_files = Path(os.path.realpath(__file__)).parent / "std_files"
     dragon_c = str(c_files / "dragon.c")
     list_c = str(c_files / "list.c")
+    alloc_c = str(c_files / "alloc.c")
 
     result = os.system(f"{compiler} -O3 -o {path.with_suffix('')} "
                        f"{' '.join(str(program.path.with_suffix('.c')) for program in unit.programs)} "
-                       f"{dragon_c} {list_c} "
+                       f"{dragon_c} {list_c} {alloc_c} "
                        f"-Wno-parentheses-equality")
 
     if result != 0:
@@ -0,0 +1,26 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include "alloc.h"
+
+
+struct drgn_block* drgn_free_lists[DRGN_SIZE_CLASSES];
+
+
+// cuts a new slab into blocks of the size class, links them into its free list, and returns the first
+struct drgn_block* drgn_refill(int size_class) {
+    size_t block_size = (size_t) (size_class + 1) * DRGN_SIZE_CLASS;
+    char* slab = malloc(DRGN_SLAB_SIZE);
+    if (slab == NULL) {
+        fprintf(stderr, "Out of memory\n");
+        exit(1);
+    }
+
+    size_t blocks = DRGN_SLAB_SIZE / block_size;
+    for (size_t i = 0; i < blocks - 1; i++) {
+        ((struct drgn_block*) (slab + i * block_size))->next = (struct drgn_block*) (slab + (i + 1) * block_size);
+    }
+    ((struct drgn_block*) (slab + (blocks - 1) * block_size))->next = NULL;
+
+    drgn_free_lists[size_class] = (struct drgn_block*) slab;
+    return drgn_free_lists[size_class];
+}
@@ -0,0 +1,67 @@
+#ifndef DRAGON_ALLOC_H
+#define DRAGON_ALLOC_H
+
+#include <stddef.h>
+#include <stdlib.h>
+
+// Objects are allocated from free lists, one for each size class of DRGN_SIZE_CLASS bytes up to DRGN_MAX_POOLED,
+// which are refilled by cutting slabs of DRGN_SLAB_SIZE bytes into blocks. Bigger allocations go to malloc.
+// Slabs are never given back, so freed blocks can only be reused by allocations of the same size class.
+// Compiling with -DDRGN_MALLOC makes every allocation go to malloc instead.
+// Blocks hold exactly the size asked for, so the characters of a String take len bytes, without a terminating NUL.
+
+#define DRGN_SIZE_CLASS 16
+#define DRGN_MAX_POOLED 256
+#define DRGN_SLAB_SIZE (64 * 1024)
+
+#define DRGN_SIZE_CLASSES (DRGN_MAX_POOLED / DRGN_SIZE_CLASS)
+
+struct drgn_block {
+    struct drgn_block* next;
+};
+
+extern struct drgn_block* drgn_free_lists[DRGN_SIZE_CLASSES];
+
+struct drgn_block* drgn_refill(int size_class);
+
+
+static inline int drgn_size_class(size_t size) {
+    return size == 0 ? 0 : (int) ((size - 1) / DRGN_SIZE_CLASS);
+}
+
+
+static inline void* drgn_alloc(size_t size) {
+#ifdef DRGN_MALLOC
+    return malloc(size);
+#else
+    if (size > DRGN_MAX_POOLED) {
+        return malloc(size);
+    }
+    int size_class = drgn_size_class(size);
+    struct drgn_block* block = drgn_free_lists[size_class];
+    if (block == NULL) {
+        block = drgn_refill(size_class);
+    }
+    drgn_free_lists[size_class] = block->next;
+    return block;
+#endif
+}
+
+
+// size must be the size the block was allocated with
+static inline void drgn_free(void* ptr, size_t size) {
+#ifdef DRGN_MALLOC
+    free(ptr);
+#else
+    if (size > DRGN_MAX_POOLED) {
+        free(ptr);
+        return;
+    }
+    int size_class = drgn_size_class(size);
+    struct drgn_block* block = ptr;
+    block->next = drgn_free_lists[size_class];
+    drgn_free_lists[size_class] = block;
+#endif
+}
+
+#endif
@@ -20,6 +20,9 @@ void* drgn_inc_ref(void* obj) {
 }
 
 
+void drgn_del_immortal(void* obj) { }
+
+
 bool is_null(struct Object* obj) {
     return obj->meta.self == NULL;
 }
@@ -43,17 +46,21 @@ void new_parent_Object(struct Object* parent_ptr, void* child_ptr, void* self_pt
 void del_String(void* obj) {
     struct String* str = obj;
     // printf("Freeing str %s\n", str->str);
-    free(str->str);
-    free(str);
+    if (str->base != NULL) {
+        DRGN_DECREF(str->base);
+    } else if (str->str != str->small) {
+        drgn_free(str->str, str->len);
+    }
+    drgn_free(str, sizeof(struct String));
 }
 
 
-struct String* _new_String(char* chars, int len) {
-    struct String* obj = malloc(sizeof(struct String));
+static struct String* new_empty_String() {
+    struct String* obj = drgn_alloc(sizeof(struct String));
 
-    obj->str = memcpy(calloc(len, sizeof(char)), chars, len);
-    obj->len = len;
     obj->get_item = String_get_item;
+    obj->slice = String_slice;
+    obj->base = NULL;
 
     obj->meta.self = obj;
     obj->meta.up = obj;
@@ -68,6 +75,34 @@ struct String* _new_String(char* chars, int len) {
     return obj;
 }
 
+
+struct String* _new_String(char* chars, int len) {
+    struct String* obj = new_empty_String();
+
+    obj->str = memcpy(len <= DRGN_SMALL_STRING ? obj->small : drgn_alloc(len), chars, len);
+    obj->len = len;
+
+    return obj;
+}
+
+
+// the len characters of base from start, shared with base rather than copied unless there are few enough to inline
+static struct String* String_view(struct String* base, int start, int len) {
+    if (len <= DRGN_SMALL_STRING) {
+        return _new_String(base->str + start, len);
+    }
+
+    struct String* obj = new_empty_String();
+    obj->str = base->str + start;
+    obj->len = len;
+
+    // a view of a view shares the characters of the string they both view
+    obj->base = base->base != NULL ? base->base : base;
+    DRGN_INCREF(obj->base);
+
+    return obj;
+}
+
 struct String* new_String(void* _obj) {
     struct Object* obj = _obj;
     struct String* str = (*obj).to_string(obj);
@@ -83,7 +118,26 @@ struct String* String_to_string(void* _self) {
 
 struct String* String_get_item(void* _self, int32_t index) {
     struct String* self = _self;
-    return _new_String(self->str + index, 1);
+    if (index < 0 || index >= self->len) {
+        printf("Cannot get index %i: out of range (length %i)\n", index, self->len);
+        return String_view(self, 0, 0);
+    }
+    return String_view(self, index, 1);
+}
+
+
+struct String* String_slice(void* _self, int32_t start, int32_t end) {
+    struct String* self = _self;
+    if (start < 0) {
+        start = 0;
+    }
+    if (end > self->len) {
+        end = self->len;
+    }
+    if (end < start) {
+        end = start;
+    }
+    return String_view(self, start, end - start);
 }
 
 
@@ -95,12 +149,11 @@ void new_parent_Integer(struct Integer* parent_ptr, void* child_ptr, void* self_
 
 void del_Integer(void* obj) {
     struct Integer* num = obj;
-    free(num);
+    drgn_free(num, sizeof(struct Integer));
 }
 
 
-struct Integer* _new_Integer(int num) {
-    struct Integer* obj = malloc(sizeof(struct Integer));
+static void init_Integer(struct Integer* obj, int num) {
     obj->num = num;
 
     obj->meta.self = obj;
@@ -113,11 +166,29 @@ struct Integer* _new_Integer(int num) {
     new_parent_Object((&obj->parent_Object), obj, obj);
 
     obj->parent_Object.to_string = Integer_to_string;
+}
+
 
+struct Integer* _new_Integer(int num) {
+    struct Integer* obj = drgn_alloc(sizeof(struct Integer));
+    init_Integer(obj, num);
     return obj;
 }
 
 
+struct Integer drgn_small_ints[DRGN_SMALL_INT_MAX - DRGN_SMALL_INT_MIN + 1];
+
+
+void drgn_init() {
+    for (int i = 0; i <= DRGN_SMALL_INT_MAX - DRGN_SMALL_INT_MIN; i++) {
+        struct Integer* obj = &drgn_small_ints[i];
+        init_Integer(obj, DRGN_SMALL_INT_MIN + i);
+        obj->meta.ref_count = DRGN_IMMORTAL;
+        obj->meta.del = drgn_del_immortal;
+    }
+}
+
+
 struct String* Integer_to_string(void* _self) {
     struct Integer* self = _self;
     char buffer[100];
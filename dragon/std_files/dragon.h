@@ -2,9 +2,13 @@
 #define DRAGON_OBJECT_H
 
 #include <stdbool.h>
+#include <stddef.h>
+#include <limits.h>
 #include <stdlib.h>
 #include <stdio.h>
 
+#include "alloc.h"
+
 #define GET_META(obj) ((struct BaseObject*) (obj)->meta.self)
 
 #define DRGN_INCREF(obj) (*(GET_META(obj)->ref_ptr))++
@@ -18,6 +22,16 @@
         }  \
     } while(0)
 
+// gives up a reference without deleting the object, such as one which is being returned
+#define DRGN_RELEASE(obj) (*(GET_META(obj)->ref_ptr))--
+
+// holds an object which is being returned, if there is one, while the locals which may own it are released
+#define DRGN_HOLD(obj) do { if ((obj) != NULL) DRGN_INCREF(obj); } while(0)
+#define DRGN_UNHOLD(obj) do { if ((obj) != NULL) DRGN_RELEASE(obj); } while(0)
+
+// the reference count of objects which are never deleted, out of reach of any program
+#define DRGN_IMMORTAL (UINT_MAX / 2)
+
 
 // struct Linked {
 //     struct BaseObject* obj;
@@ -43,17 +57,33 @@ struct Object {
 };
 
 
+#define DRGN_SMALL_STRING 16
+
+
 struct String {
     struct BaseObject meta;
 
     struct Object parent_Object;
 
-    char* str;
+    char* str;                        // len characters, with no NUL after them: a view's are inside its base's
     int32_t len;
     struct String* (*get_item)(void*, int32_t);
+    struct String* (*slice)(void*, int32_t, int32_t);
+
+    struct String* base;              // a view shares the characters of its base, which it holds a reference to
+    char small[DRGN_SMALL_STRING];   // the characters of short strings, which aren't allocated separately
 };
 
 
+// defines a static, immortal String, for string literals
+#define DRGN_STRING_LITERAL(name, chars, length) static struct String name = {  \
+        .meta = {.self = &name, .up = &name, .ref_count = DRGN_IMMORTAL, .del = drgn_del_immortal,  \
+                 .ref_ptr = &name.meta.ref_count},  \
+        .parent_Object = {.meta = {.self = &name, .up = &name}, .to_string = String_to_string},  \
+        .str = chars, .len = length, .get_item = String_get_item, .slice = String_slice, .base = NULL  \
+    }
+
+
 struct Integer {
     struct BaseObject meta;
 
@@ -65,6 +95,8 @@ struct Integer {
 
 void* drgn_inc_ref(void*);
 
+void drgn_del_immortal(void*);
+
 
 bool is_null(struct Object*);
 
@@ -79,6 +111,7 @@ struct String* new_String(void*);
 
 struct String* String_to_string(void*);
 struct String* String_get_item(void*, int32_t);
+struct String* String_slice(void*, int32_t, int32_t);
 
 
 struct Integer* _new_Integer(int);
@@ -87,6 +120,23 @@ void new_parent_Integer(struct Integer*, void*, void*);
 struct String* Integer_to_string(void*);
 
 
+#define DRGN_SMALL_INT_MIN (-128)
+#define DRGN_SMALL_INT_MAX 1024
+
+// preallocated by drgn_init, and never freed
+extern struct Integer drgn_small_ints[DRGN_SMALL_INT_MAX - DRGN_SMALL_INT_MIN + 1];
+
+// boxes an int, without allocating if it is small
+static inline struct Integer* drgn_box_int(int num) {
+    if (num >= DRGN_SMALL_INT_MIN && num <= DRGN_SMALL_INT_MAX) {
+        return &drgn_small_ints[num - DRGN_SMALL_INT_MIN];
+    }
+    return _new_Integer(num);
+}
+
+void drgn_init();
+
+
 void print(struct Object*);
 
 int32_t dragon_clock();
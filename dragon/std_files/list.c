@@ -1,5 +1,6 @@
 #include <stdlib.h>
 #include <stdio.h>
+#include <string.h>
 #include "dragon.h"
 #include "list.h"
 
@@ -7,11 +8,21 @@
 struct _Array;
 
 
+void del__Array(void* obj) {
+    struct _Array* arr = obj;
+    drgn_free(arr->items, arr->length * sizeof(struct Object*));
+    drgn_free(arr, sizeof(struct _Array));
+}
+
+
 struct _Array* new__Array(int size) {
-    void* mem = calloc(size, sizeof(struct Object**));
-    struct _Array* arr = malloc(sizeof(struct _Array));
+    void* mem = memset(drgn_alloc(size * sizeof(struct Object*)), 0, size * sizeof(struct Object*));
+    struct _Array* arr = drgn_alloc(sizeof(struct _Array));
     arr->meta.self = arr;
     arr->meta.up = arr;
+    arr->meta.ref_count = 0;
+    arr->meta.ref_ptr = &(arr->meta.ref_count);
+    arr->meta.del = del__Array;
 
     arr->length = size;
     arr->items = mem;
@@ -0,0 +1,45 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from dragon.run import compile_file
+
+CC = os.environ.get("CC", "clang" if shutil.which("clang") else "gcc")
+
+SANITIZE = "-fsanitize=address,undefined -fno-sanitize-recover=all -DDRGN_MALLOC"
+"""Makes programs abort on any use of freed memory, which malloc (rather than the runtime's allocator) lets it see"""
+
+SANITIZE_ENV = {**os.environ, "ASAN_OPTIONS": "detect_leaks=0"}
+"""Objects which are never released are not yet an error, only using them after they are deleted is"""
+
+
+def can_sanitize(tmp_path) -> bool:
+    source = tmp_path / "sanitize.c"
+    source.write_text("int main() { return 0; }\n")
+    result = subprocess.run(f"{CC} {SANITIZE} -o {tmp_path / 'sanitize'} {source}", shell=True, capture_output=True)
+    return result.returncode == 0
+
+
+@pytest.fixture
+def run_drgn(tmp_path):
+    """
+    Compiles the source of a Dragon program with `CC` (and any extra flags), runs it and returns what it printed.
+    Passing sanitize=True builds it with `SANITIZE`.
+    """
+    if shutil.which(CC.split()[0]) is None:
+        pytest.skip(f"{CC} is not installed")
+
+    def run(source: str, flags: str = "", sanitize: bool = False) -> str:
+        if sanitize:
+            if not can_sanitize(tmp_path):
+                pytest.skip(f"{CC} cannot build with {SANITIZE}")
+            flags += " " + SANITIZE
+        path = tmp_path / "program.drgn"
+        path.write_text(source)
+        compile_file(path, compiler=f"{CC} -w {flags}")
+        return subprocess.run([str(path.with_suffix(""))], check=True, capture_output=True, text=True,
+                              env=SANITIZE_ENV if sanitize else None).stdout
+
+    return run
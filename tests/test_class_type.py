@@ -0,0 +1,30 @@
+import pytest
+
+from dragon.common import cgen
+
+
+def chain(depth: int) -> cgen.ClassType:
+    cls = cgen.Object
+    for n in range(depth):
+        cls = cgen.ClassType(f"Level{n}", [cls])
+        cls.add_attr(f"attr_{n}", cgen.Int)
+        cls.finalize()
+    return cls
+
+
+def test_lookups_are_a_single_node():
+    leaf = chain(3)
+    obj = cgen.GetVar("obj")
+
+    get = leaf.get_name_expr(obj, "attr_0")
+    assert get == cgen.GetAttr(obj, "parent_Level1.parent_Level0.attr_0")
+    assert get.generate() == "obj.parent_Level1.parent_Level0.attr_0"
+    assert leaf.get_name_expr(obj, "attr_2").generate() == "obj.attr_2"
+    assert leaf.cast_expr(obj, cgen.Object).generate() == "obj.parent_Level1.parent_Level0.parent_Object"
+    assert leaf.cast_expr(obj, leaf) is obj
+
+
+def test_members_cant_be_added_once_finalized():
+    leaf = chain(1)
+    with pytest.raises(AssertionError, match="Level0 is already finalized"):
+        leaf.add_attr("late", cgen.Int)
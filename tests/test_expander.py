@@ -0,0 +1,84 @@
+import pathlib
+
+import pytest
+
+from dragon.common import ast
+from dragon.passes import parse, scan
+from dragon.passes.expander import Expander
+from dragon.passes.resolver import Resolver
+
+
+LIMIT = "#macro $( LIMIT )$ => expr: $( (60) )$ #endmacro\n"
+
+BRANCHES = LIMIT + """
+def f(a: int) -> int {
+    while (LIMIT < 10) {
+        print("never");
+    }
+    if (LIMIT * 2 > 100) {
+        print("taken");
+        return a;
+        print("unreachable");
+    } else {
+        print("never");
+    }
+}
+
+def main() -> int {
+    print(f(1));
+    print(LIMIT * 2 + 1);
+    return 0;
+}
+"""
+
+
+def expand(source: str) -> ast.Program:
+    tree = parse(scan(source))
+    Resolver().visit_Program(tree, pathlib.Path("program.drgn"))
+    return Expander().visit(tree)
+
+
+def function(tree: ast.Program, name: str) -> ast.Function:
+    return next(top_level for top_level in tree.top_level if getattr(top_level, "name", None) == name)
+
+
+def printed(stmt: ast.Stmt) -> ast.Expr:
+    assert isinstance(stmt, ast.ExprStmt) and stmt.expr.callee.var == "print"
+    return stmt.expr.args[0]
+
+
+@pytest.mark.parametrize("expr, val", [
+    ("LIMIT * 2 + 1", 121),
+    ("(1 + 2) * (3 + 4)", 21),
+    ("0 - 7 / 2", -3),
+    ("2147483647 + 1", -2147483648),
+    ("LIMIT * 2 > 100", 1),
+    ("3 == 4", 0),
+])
+def test_folds_int_literals(expr, val):
+    tree = expand(f"{LIMIT}def main() -> int {{\n    print({expr});\n    return 0;\n}}\n")
+    folded = printed(function(tree, "main").body[0])
+
+    assert isinstance(folded, ast.Literal)
+    assert folded.meta["val"] == val and folded.val == str(val)
+
+
+@pytest.mark.parametrize("expr", ["1 / 0", "a + 1", "(0 - 2147483647 - 1) / (0 - 1)"])
+def test_leaves_the_rest_to_run_time(expr):
+    tree = expand(f"def main() -> int {{\n    var a: int = 1;\n    print({expr});\n    return 0;\n}}\n")
+    assert isinstance(printed(function(tree, "main").body[1]), ast.BinOp)
+
+
+def test_prunes_dead_loops_and_branches():
+    body = function(expand(BRANCHES), "f").body
+
+    # the loop is gone, and the if replaced by the block it always takes, without the statement after its return
+    (taken,) = body
+    assert isinstance(taken, ast.Block)
+    assert printed(taken.stmts[0]).val == '"taken"'
+    assert isinstance(taken.stmts[1], ast.ReturnStmt) and len(taken.stmts) == 2
+    assert not any(isinstance(node, (ast.WhileStmt, ast.IfStmt)) for node in ast.walk(body))
+
+
+def test_expanded_programs_run(run_drgn):
+    assert run_drgn(BRANCHES) == "taken1121"
@@ -0,0 +1,63 @@
+import pathlib
+
+from dragon.passes import parse, scan
+from dragon.passes.hierarchy import ClassHierarchy
+from dragon.passes.resolver import Resolver
+
+
+# E inherits get from C, which overrides A's, so calls through either of its other ancestors A and D must use its
+# vtable, although E itself defines nothing
+TWO_BASES = """
+class A {
+    method get() -> int {
+        return 1;
+    }
+}
+
+class C(A) {
+    method get() -> int {
+        return 5;
+    }
+}
+
+class D {
+    method get() -> int {
+        return 15;
+    }
+}
+
+class E(C, D) {
+}
+
+def show(d: D) -> int {
+    print(d.get());
+    return 0;
+}
+
+def main() -> int {
+    var e: E = new E();
+    show(e);
+    var d: D = new D();
+    show(d);
+    return 0;
+}
+"""
+
+
+def resolve(source: str):
+    resolver = Resolver()
+    resolver.visit_Program(parse(scan(source)), pathlib.Path("program.drgn"))
+    # keyed by their dragon names, without the number which makes their c names unique
+    return {cls.name.rsplit("_", 1)[0]: cls for cls in resolver.classes}, ClassHierarchy(resolver.classes)
+
+
+def test_inherited_overrides_are_not_called_directly():
+    classes, hierarchy = resolve(TWO_BASES)
+
+    assert hierarchy.direct_call(classes["D"], "get") is None
+    assert hierarchy.direct_call(classes["A"], "get") is None
+    assert hierarchy.direct_call(classes["C"], "get") == classes["C"].get_func_name("get")
+
+
+def test_inherited_overrides_run(run_drgn):
+    assert run_drgn(TWO_BASES) == "515"
@@ -0,0 +1,41 @@
+import os
+import pathlib
+
+import pytest
+
+from dragon.passes import compile_drgn, compiler, parse, scan
+from dragon.passes.resolver import Resolver
+
+EXAMPLES = pathlib.Path(__file__).parent.parent / "examples"
+
+
+def generate(path: pathlib.Path, jobs: int) -> str:
+    unit = compile_drgn(parse(scan(path.read_text())), path, jobs=jobs)
+    return "\n".join(top_level.definition() for program in unit.programs for top_level in program.top_levels)
+
+
+# imports instantiates a generic class in the body of main, after the signatures of another module
+@pytest.mark.parametrize("name", ["imports", "classes", "overloading"])
+def test_jobs_generate_the_same_names(monkeypatch, name):
+    monkeypatch.chdir(EXAMPLES)
+    path = EXAMPLES / f"{name}.drgn"
+    assert generate(path, 1) == generate(path, 2) == generate(path, 4)
+
+
+def test_no_bodies_start_no_workers(monkeypatch):
+    def compile_in_workers(*args):
+        raise AssertionError("started workers without any bodies")
+
+    monkeypatch.setattr(compiler, "compile_in_workers", compile_in_workers)
+    resolver = Resolver()
+    resolver.deferred = []
+    compiler.compile_bodies(resolver, compiler.Compiler(), jobs=4)
+    assert resolver.deferred is None
+
+
+def test_bodies_of_dead_workers_are_compiled_here(monkeypatch):
+    path = EXAMPLES / "classes.drgn"
+    serial = generate(path, 1)
+    # the forked processes inherit the patched module
+    monkeypatch.setattr(compiler, "compile_worker", lambda *args: os._exit(1))
+    assert generate(path, 2) == serial
@@ -0,0 +1,75 @@
+import pytest
+
+from dragon.common import ast
+from dragon.passes import scan
+from dragon.passes.parser import MacroHole, ParseError, Parser, Stream
+
+
+TWICE = "#macro $( TWICE $body:stmt )$ => stmt: $( { $body $body } )$ #endmacro\n"
+SQUARE = "#macro $( SQUARE $x:expr )$ => expr: $( $x * $x )$ #endmacro\n"
+SET = "#macro $( SET $target:expr TO $val:expr )$ => stmt: $( $target = $val; )$ #endmacro\n"
+
+
+def parse(macros: str, body: str):
+    parser = Parser()
+    program = parser.parse_program(Stream(scan(f"{macros}def f() -> int {{\n{body}\n}}\n")))
+    return parser, program.top_level[-1].body
+
+
+def test_holes_are_replaced_by_the_arguments():
+    parser, body = parse(SQUARE, "    print(SQUARE a + 1);")
+    (square,) = body[0].expr.args
+
+    assert isinstance(square, ast.BinOp) and square.op == "*"
+    # the argument is parsed once, and not copied where the template uses it again
+    assert isinstance(square.left, ast.BinOp) and square.left is square.right
+    assert not any(isinstance(node, MacroHole) for node in ast.walk(body))
+
+
+def test_the_template_is_parsed_once_and_copied_for_each_use():
+    parser, body = parse(TWICE, "    TWICE print(1);\n    TWICE print(2);")
+    macro = parser.macros["stmt"]["TWICE"]
+    template = macro.template
+
+    first, second = body
+    assert [stmt.expr.args[0].val for stmt in first.stmts] == ["1", "1"]
+    assert [stmt.expr.args[0].val for stmt in second.stmts] == ["2", "2"]
+    assert macro.template is template and isinstance(template.stmts[0], MacroHole)
+    assert first is not second and first is not template
+
+
+def test_the_template_is_parsed_again_after_a_new_macro():
+    parser, _ = parse(TWICE, "    TWICE print(1);")
+    template = parser.macros["stmt"]["TWICE"].template
+
+    parser.parse_program(Stream(scan(SQUARE + "def g() -> int {\n    TWICE print(SQUARE 2);\n}\n")))
+    assert parser.macros["stmt"]["TWICE"].template is not template
+
+
+@pytest.mark.parametrize("target, node", [("x", ast.SetVar), ("obj.x", ast.SetAttr)])
+def test_assignments_to_holes_are_parsed_for_each_use(target, node):
+    parser, body = parse(SET, f"    SET {target} TO 1")
+
+    # whether `$target = ...` is an assignment depends on the argument, so the template can't be parsed alone
+    assert parser.macros["stmt"]["SET"].template is None
+    assert isinstance(body[0].expr, node) and body[0].expr.val.val == "1"
+
+
+def test_assignments_to_arguments_which_are_not_assignable():
+    with pytest.raises(ParseError, match="Left-hand side"):
+        parse(SET, "    SET 1 TO 2")
+
+
+def test_undefined_meta_identifiers():
+    with pytest.raises(ParseError, match=r"\$y is not defined"):
+        parse("#macro $( BAD $x:expr )$ => expr: $( $y )$ #endmacro\n", "    print(BAD 1);")
+
+
+def test_arguments_without_a_rule():
+    with pytest.raises(ParseError, match="must be of form"):
+        parse("#macro $( BAD $x )$ => expr: $( 1 )$ #endmacro\n", "    print(BAD 1);")
+
+
+def test_unmatched_tokens():
+    with pytest.raises(ParseError, match="Macro expected"):
+        parse("#macro $( DOUBLE $x:expr class )$ => expr: $( $x * 2 )$ #endmacro\n", "    print(DOUBLE 1 def);")
@@ -0,0 +1,81 @@
+import pathlib
+
+import pytest
+
+from dragon.passes import parse, scan
+from dragon.passes.resolver import Resolver, ResolvingError
+
+
+CLASSES = """
+class A {
+    attr x: int;
+}
+
+class B(A) {
+    attr y: int;
+}
+"""
+
+SHOW = CLASSES + """
+def show {
+    (o: Object) -> void {
+        print("object ");
+    }
+
+    (a: A) -> void {
+        print("A ");
+    }
+
+    (s: String) -> void {
+        print("string ");
+    }
+
+    (n: int) -> void {
+        print("int ");
+    }
+}
+"""
+
+# passing two Bs, each overload needs one coercion from B to A
+PAIR = CLASSES + """
+def pair {
+    (a: A, b: B) -> void {
+        print("AB ");
+    }
+
+    (b: B, a: A) -> void {
+        print("BA ");
+    }
+}
+"""
+
+
+def program(overloads: str, body: str) -> str:
+    return overloads + f"\ndef main() -> int {{\n{body}\n    return 0;\n}}\n"
+
+
+def resolve(source: str):
+    Resolver().visit_Program(parse(scan(source)), pathlib.Path("program.drgn"))
+
+
+@pytest.mark.parametrize("body, printed", [
+    # exact matches
+    ("    show(3);", "int "),
+    ('    show("hi");', "string "),
+    ("    var a: A = new A();\n    show(a);", "A "),
+    # coerced to the closest overload: B is one step from A and two from Object
+    ("    var b: B = new B();\n    show(b);", "A "),
+    ("    var b: B = new B();\n    var a: A = b;\n    pair(a, b);", "AB "),
+])
+def test_calls_the_closest_overload(run_drgn, body, printed):
+    assert run_drgn(program(SHOW + PAIR.replace(CLASSES, ""), body)) == printed
+
+
+def test_ties_are_ambiguous():
+    with pytest.raises(ResolvingError, match="ambiguous"):
+        resolve(program(PAIR, "    var b: B = new B();\n    pair(b, b);"))
+
+
+def test_no_overload():
+    with pytest.raises(ResolvingError, match="No overload"):
+        resolve(program(PAIR, '    pair("a", "b");'))
@@ -0,0 +1,53 @@
+# the examples in these programs are run with sanitizers, which abort them if they use an object after deleting it
+
+def test_returns_a_field_of_a_dying_local(run_drgn):
+    source = """
+class Inner {
+    attr n: int;
+}
+
+class Box {
+    attr o: Inner;
+}
+
+def field(n: int) -> Inner {
+    var b: Box = new Box();
+    var inner: Inner = new Inner();
+    inner.n = n;
+    b.o = inner;
+    return b.o;
+}
+
+def main() -> int {
+    var inner: Inner = field(42);
+    print(inner.n);
+    return 0;
+}
+"""
+    assert run_drgn(source, sanitize=True) == "42"
+
+
+def test_borrowed_locals_are_not_released(run_drgn):
+    source = """
+class Node {
+    attr val: int;
+    attr next: Node;
+
+    method get_next() -> Node {
+        var next: Node = self.next;
+        return next;
+    }
+}
+
+def main() -> int {
+    var first: Node = new Node();
+    var second: Node = new Node();
+    second.val = 7;
+    first.next = second;
+    second.next = first;
+    var node: Node = first.get_next();
+    print(node.val);
+    return 0;
+}
+"""
+    assert run_drgn(source, sanitize=True) == "7"
@@ -0,0 +1,59 @@
+import pickle
+from dataclasses import dataclass
+
+from dragon.common import ast
+from dragon.passes import parse, parse_cache, scan
+from dragon.passes.parse_cache import HEADER, ParseCache
+
+
+SOURCE = "def f() -> int {\n    return 1;\n}\n"
+
+
+def cached_file(cache: ParseCache):
+    return cache.directory / (cache.key(SOURCE) + ".pickle")
+
+
+def test_hits_after_a_miss(tmp_path):
+    cache = ParseCache(tmp_path)
+    first = cache.parse(SOURCE)
+    second = cache.parse(SOURCE)
+
+    assert isinstance(second, ast.Program)
+    assert len(second.top_level) == len(first.top_level) == 1
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_files_without_the_header_are_not_unpickled(tmp_path):
+    cache = ParseCache(tmp_path)
+    cached_file(cache).write_bytes(pickle.dumps(ast.Program([])))
+
+    assert len(cache.parse(SOURCE).top_level) == 1
+    assert cache.stats.misses == 1
+
+
+def test_stale_files_are_a_miss(tmp_path):
+    cache = ParseCache(tmp_path)
+    # refers to a class which no longer exists, as if pickled by an older version
+    stale = pickle.dumps(ast.Program([])).replace(b"Program", b"Removed")
+    cached_file(cache).write_bytes(HEADER + stale)
+
+    assert len(cache.parse(SOURCE).top_level) == 1
+    assert cache.stats.misses == 1
+
+
+def test_trees_which_cant_be_pickled_are_not_stored(tmp_path):
+    cache = ParseCache(tmp_path)
+    program = parse(scan(SOURCE))
+    program.top_level[0].meta["unpicklable"] = lambda: None
+
+    cache.store(cached_file(cache), program)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_changing_a_node_changes_the_key(monkeypatch):
+    @dataclass()
+    class Added(ast.Stmt):
+        value: ast.Expr
+
+    monkeypatch.setattr(ast, "Added", Added, raising=False)
+    assert parse_cache.ast_fingerprint() != parse_cache.AST_FINGERPRINT
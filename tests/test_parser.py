@@ -0,0 +1,121 @@
+import pytest
+
+from dragon.common import ast
+from dragon.passes import parse, scan, scan_iter
+from dragon.passes.parser import END, IncrementalParser, Parser, Stream, TokenBuffer
+
+
+FUNCTION = "def f() -> int {\n    return 1;\n}\n"
+
+
+def lines(node):
+    return [child.line for child in ast.walk([node])]
+
+
+def test_reuses_moved_statements():
+    parser = IncrementalParser()
+    first = parser.parse(scan(FUNCTION))
+    second = parser.parse(scan("\n\n" + FUNCTION))
+
+    assert parser.reused == 1
+    assert second.top_level[0] is first.top_level[0]
+    assert lines(second.top_level[0]) == [3, 3, 4, 4]
+
+
+def test_duplicate_statements_are_not_shared():
+    parser = IncrementalParser()
+    parser.parse(scan(FUNCTION + FUNCTION))
+    program = parser.parse(scan("\n\n" + FUNCTION + FUNCTION))
+
+    top, bottom = program.top_level
+    assert top is not bottom
+    assert lines(top) == [3, 3, 4, 4]
+    assert lines(bottom) == [6, 6, 7, 7]
+
+
+def test_buffer_reads_ahead_across_releases():
+    source = FUNCTION * 3
+    expected = scan(source)
+    pulled = []
+
+    def tokens():
+        for token in scan_iter(source):
+            pulled.append(token)
+            yield token
+
+    buffer = TokenBuffer(tokens())
+    assert buffer.get(5) == expected[5]
+    assert len(pulled) == 6
+
+    buffer.release(4)
+    assert buffer.start == 4 and len(buffer.window) == 2
+    # the first token after the window, and the last one in it, are still read correctly
+    assert buffer.get(6) == expected[6]
+    assert buffer.get(5) == expected[5]
+    assert buffer.get(4) == expected[4]
+    assert buffer.kind(len(expected) - 1) == expected[len(expected) - 1].kind
+    assert buffer.get(len(expected)) is END
+
+
+def test_buffer_is_released_after_each_top_level():
+    windows = []
+
+    class RecordingParser(Parser):
+        def parse_top_level(self, stream: Stream):
+            windows.append((stream.buffer.start, stream.index, len(stream.buffer.window)))
+            return super().parse_top_level(stream)
+
+    RecordingParser().parse_program(Stream(scan_iter(FUNCTION * 3)))
+
+    statement = len(scan(FUNCTION))
+    assert [start for start, _, _ in windows] == [0, statement, statement * 2]
+    # only the first token of the next statement has been read ahead, rather than the tokens of the earlier ones
+    assert all(start == index and size == 1 for start, index, size in windows)
+
+
+def show(node) -> str:
+    """Writes out an expression with every operator application in parentheses, and groupings in brackets"""
+    if isinstance(node, ast.BinOp):
+        return f"({show(node.left)} {node.op} {show(node.right)})"
+    elif isinstance(node, ast.Unary):
+        return f"({node.op}{show(node.right)})"
+    elif isinstance(node, ast.Cast):
+        return f"({show(node.obj)} as {node.type.name})"
+    elif isinstance(node, ast.SetVar):
+        return f"({node.var} = {show(node.val)})"
+    elif isinstance(node, ast.Grouping):
+        return f"[{show(node.expr)}]"
+    elif isinstance(node, ast.Call):
+        return f"{show(node.callee)}({', '.join(show(arg) for arg in node.args)})"
+    elif isinstance(node, ast.GetAttr):
+        return f"{show(node.obj)}.{node.attr}"
+    elif isinstance(node, ast.GetVar):
+        return node.var
+    elif isinstance(node, ast.Literal):
+        return node.val
+    raise TypeError(node)
+
+
+# as the grammar with one rule per level of precedence parsed them, except for the prefix operators, which it failed on,
+# and which bind tighter than any binary operator or cast, as its rules had them
+@pytest.mark.parametrize("source, tree", [
+    ("a - b - c", "((a - b) - c)"),
+    ("a + b * c", "(a + (b * c))"),
+    ("a * b + c", "((a * b) + c)"),
+    ("a / b // c % d", "(((a / b) // c) % d)"),
+    ("(a + b) * c", "([(a + b)] * c)"),
+    ("a + b < c * d", "((a + b) < (c * d))"),
+    ("a < b == c > d", "((a < b) == (c > d))"),
+    ("a == b != c", "((a == b) != c)"),
+    ("a <= b - 1", "(a <= (b - 1))"),
+    ("-a * b", "((-a) * b)"),
+    ("a - -b", "(a - (-b))"),
+    ("!-a", "(!(-a))"),
+    ("-a.b(c)", "(-a.b(c))"),
+    ("-a as int", "((-a) as int)"),
+    ("a + b as int", "(a + (b as int))"),
+    ("x = y = a + b * c", "(x = (y = (a + (b * c))))"),
+])
+def test_precedence_and_associativity(source, tree):
+    program = parse(scan(f"def f() -> int {{\n    {source};\n}}\n"))
+    assert show(program.top_level[0].body[0].expr) == tree
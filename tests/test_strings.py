@@ -0,0 +1,55 @@
+# 43 characters, so that its slices of more than 16 are views of the literal rather than copies
+FOX = '"The quick brown fox jumps over the lazy dog"'
+
+PROGRAM = """
+def show(s: String) -> int {
+    print(s);
+    print("|");
+    return 0;
+}
+
+def part(s: String) -> String {
+    var view: String = s.slice(4, 40);
+    return view.slice(2, 30);
+}
+
+def main() -> int {
+    var fox: String = FOX;
+    var n: int = 0;
+    while (n < 2) {
+        show(part(fox));
+        show(part(fox).slice(0, 17));
+        show(part(fox).slice(0, 16));
+        show(fox.slice(0 - 5, 3));
+        show(fox.slice(40, 100));
+        show(fox.slice(10, 2));
+        show(fox.slice(0, 1000).slice(40, 43));
+        show(FOX.get_item(0));
+        show(FOX.get_item(42));
+        show(part(fox).get_item(27));
+        show(fox.get_item(43));
+        print("\\n");
+        n = n + 1;
+    }
+    return 0;
+}
+""".replace("FOX", FOX)
+
+EXPECTED = "|".join([
+    "ick brown fox jumps over the",
+    "ick brown fox jum",
+    "ick brown fox ju",
+    "The",
+    "dog",
+    "",
+    "dog",
+    "T",
+    "g",
+    "e",
+    "Cannot get index 43: out of range (length 43)\n",
+]) + "|\n"
+
+
+def test_views_and_slices(run_drgn):
+    # sanitized, so that reading past the characters of a string or using a freed base is an error
+    assert run_drgn(PROGRAM, sanitize=True) == EXPECTED * 2